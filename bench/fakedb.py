@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('FakeSQLPool', 'seed')
+
+import random
+import re
+import sqlite3
+import string
+import time
+from typing import Any
+from typing import Optional
+
+from objects.utils import get_safe_name
+
+SCHEMA = '''
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY, name TEXT, safe_name TEXT, email TEXT,
+    priv INTEGER, pw_bcrypt TEXT, country TEXT, silence_end INTEGER,
+    donor_end INTEGER, creation_time INTEGER, latest_activity INTEGER,
+    clan_id INTEGER, clan_priv INTEGER
+);
+CREATE UNIQUE INDEX users_safe_name ON users (safe_name);
+
+CREATE TABLE stats (
+    id INTEGER, mode INTEGER, tscore INTEGER, rscore INTEGER,
+    pp INTEGER, plays INTEGER, playtime INTEGER, acc REAL,
+    max_combo INTEGER, PRIMARY KEY (id, mode)
+);
+CREATE INDEX stats_mode_pp ON stats (mode, pp);
+
+CREATE TABLE maps (
+    id INTEGER PRIMARY KEY, set_id INTEGER, status INTEGER, md5 TEXT,
+    artist TEXT, title TEXT, version TEXT, creator TEXT,
+    total_length INTEGER, max_combo INTEGER, mode INTEGER, bpm REAL,
+    cs REAL, od REAL, ar REAL, hp REAL, diff REAL
+);
+CREATE UNIQUE INDEX maps_md5 ON maps (md5);
+
+CREATE TABLE user_achievements (userid INTEGER, achid INTEGER);
+'''
+
+SCORES_SCHEMA = '''
+CREATE TABLE scores_{mods} (
+    id INTEGER PRIMARY KEY, map_md5 TEXT, score INTEGER, pp REAL,
+    acc REAL, max_combo INTEGER, mods INTEGER, n300 INTEGER,
+    n100 INTEGER, n50 INTEGER, nmiss INTEGER, ngeki INTEGER,
+    nkatu INTEGER, grade TEXT, status INTEGER, mode INTEGER,
+    play_time INTEGER, time_elapsed INTEGER, client_flags INTEGER,
+    userid INTEGER, perfect INTEGER
+);
+CREATE INDEX scores_{mods}_user ON scores_{mods} (userid, mode);
+'''
+
+# mysql-only syntax the app uses, and its sqlite equivalent; queries
+# are translated before they're run, so it's the app's own sql that's
+# measured (though sqlite's plan for it is not mysql's).
+DIALECT = (
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\bAS\s+UNSIGNED\b', re.IGNORECASE), 'AS INTEGER'),
+)
+
+# mysql-only syntax with no sqlite equivalent; rather than run some
+# other query, these fail (and are counted as errors in the results).
+UNSUPPORTED = re.compile(
+    r'\b(FORCE\s+INDEX|USE\s+INDEX|STRAIGHT_JOIN|SQL_CALC_FOUND_ROWS|'
+    r'ON\s+DUPLICATE\s+KEY|LOCK\s+IN\s+SHARE\s+MODE)\b', re.IGNORECASE)
+
+GRADES = ('XH', 'X', 'SH', 'S', 'A', 'B', 'C', 'D', 'F')
+COUNTRIES = ('us', 'ca', 'gb', 'de', 'fr', 'jp', 'kr', 'br', 'pl', 'ru')
+
+
+class FakeSQLPool:
+    """An in-process stand-in for `objects.database.RoutedSQLPool`,
+    backed by an sqlite database; it also counts its queries.
+
+    NOTE: queries run synchronously, so (unlike with MySQL) time
+    spent in the database also holds up the event loop."""
+
+    def __init__(self, path: str = ':memory:') -> None:
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.create_function('UNIX_TIMESTAMP', 0, lambda: int(time.time()))
+
+        self.queries = 0
+        self.query_time = 0.0
+
+        self.pools = ()  # no real pools to report on
+
+    async def connect(self, *args: Any, **kwargs: Any) -> None:
+        pass
+
+    async def close(self) -> None:
+        self.conn.close()
+
+    async def run(self, interval: int) -> None:
+        pass
+
+    def _execute(self, query: str,
+                 params: Optional[list] = None) -> sqlite3.Cursor:
+        if (m := UNSUPPORTED.search(query)):
+            raise sqlite3.NotSupportedError(f'mysql-only sql: {m[0]}')
+
+        for pattern, replacement in DIALECT:
+            query = pattern.sub(replacement, query)
+
+        start = time.perf_counter()
+        cursor = self.conn.execute(query, params or [])
+        self.query_time += time.perf_counter() - start
+        self.queries += 1
+        return cursor
+
+    async def fetch(self, query: str, params: Optional[list] = None,
+                    _dict: bool = True) -> Optional[dict[str, Any]]:
+        row = self._execute(query, params).fetchone()
+        if row is None:
+            return None
+        return dict(row) if _dict else tuple(row)
+
+    async def fetchall(self, query: str, params: Optional[list] = None,
+                       _dict: bool = True) -> list:
+        rows = self._execute(query, params).fetchall()
+        return [dict(row) if _dict else tuple(row) for row in rows]
+
+    async def execute(self, query: str,
+                      params: Optional[list] = None) -> int:
+        cursor = self._execute(query, params)
+        self.conn.commit()
+        return cursor.lastrowid
+
+
+def _name(rng: random.Random) -> str:
+    # mixed case, & sometimes two words, so safe names differ.
+    return ' '.join(''.join(rng.choices(string.ascii_letters, k=rng.randint(2, 6)))
+                    for _ in range(rng.randint(1, 2)))
+
+
+def seed(pool: FakeSQLPool, users: int, maps: int,
+         scores_per_user: int, rng_seed: int = 0) -> None:
+    """Fill `pool` with synthetic users, stats, maps & scores."""
+    rng = random.Random(rng_seed)
+    conn = pool.conn
+
+    conn.executescript(SCHEMA)
+    for mods in ('vn', 'rx', 'ap'):
+        conn.executescript(SCORES_SCHEMA.format(mods=mods))
+
+    now = int(time.time())
+
+    # id 1 is the bot, as in gulag.
+    conn.execute(
+        'INSERT INTO users (id, name, safe_name, email, priv, country, '
+        'creation_time, latest_activity) '
+        "VALUES (1, 'Bot', 'bot', 'bot@localhost', 1, 'ca', 0, 0)"
+    )
+    names = {user_id: f'{_name(rng)}{user_id}' for user_id in range(2, users + 2)}
+    conn.executemany(
+        'INSERT INTO users VALUES (?, ?, ?, ?, ?, ?, ?, 0, 0, ?, ?, 0, 0)',
+        [(user_id, name, get_safe_name(name),
+          f'user{user_id}@example.com', rng.choice((3, 3, 3, 3, 2, 31)),
+          '', rng.choice(COUNTRIES), now - rng.randint(0, 10 ** 8), now)
+         for user_id, name in names.items()]
+    )
+    conn.executemany(
+        'INSERT INTO stats VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        [(user_id, mode, rng.randint(0, 10 ** 10), rng.randint(0, 10 ** 9),
+          rng.randint(0, 12000), rng.randint(0, 50000),
+          rng.randint(0, 10 ** 6), rng.uniform(70, 100), rng.randint(0, 3000))
+         for user_id in range(2, users + 2) for mode in range(8)]
+    )
+    conn.executemany(
+        'INSERT INTO maps (id, set_id, status, md5, artist, title, version, '
+        'creator, total_length, max_combo, mode, bpm, cs, od, ar, hp, diff) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?, 4, 8, 9, 5, ?)',
+        [(map_id, map_id // 4, rng.choice((2, 2, 2, 0, 5)),
+          f'{map_id:032x}', _name(rng), _name(rng), _name(rng), _name(rng),
+          rng.randint(30, 600), rng.randint(100, 3000),
+          rng.uniform(60, 300), rng.uniform(1, 9))
+         for map_id in range(1, maps + 1)]
+    )
+
+    for mods, modes in (('vn', 4), ('rx', 3), ('ap', 1)):
+        conn.executemany(
+            f'INSERT INTO scores_{mods} (map_md5, score, pp, acc, max_combo, '
+            'mods, n300, n100, n50, nmiss, ngeki, nkatu, grade, status, mode, '
+            'play_time, time_elapsed, client_flags, userid, perfect) '
+            'VALUES (?, ?, ?, ?, ?, 0, ?, ?, ?, ?, 0, 0, ?, ?, ?, ?, ?, 0, ?, ?)',
+            [(f'{rng.randint(1, maps):032x}', rng.randint(0, 10 ** 7),
+              rng.uniform(0, 700), rng.uniform(70, 100), rng.randint(0, 3000),
+              rng.randint(0, 1000), rng.randint(0, 100), rng.randint(0, 10),
+              rng.randint(0, 20), rng.choice(GRADES), rng.choice((0, 1, 2)),
+              rng.randrange(modes), now - rng.randint(0, 10 ** 7),
+              rng.randint(0, 600000), user_id, rng.randint(0, 1))
+             for user_id in range(2, users + 2)
+             for _ in range(scores_per_user)]
+        )
+
+    conn.commit()
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmarks gulag-web's /gw_api routes against a synthetic database.
+
+Usage:
+    python3.9 -m bench.run [--users N] [--scores N] [--concurrency N]
+                           [--requests N] [--output results.json]
+    python3.9 -m bench.run --compare old.json new.json
+"""
+
+__all__ = ()
+
+import argparse
+import asyncio
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable
+
+import orjson
+
+from bench.fakedb import FakeSQLPool
+from bench.fakedb import seed
+
+# {name: callable(rng, users) -> url}
+# only routes whose sql `FakeSQLPool` runs as-is (or translates; see
+# `bench.fakedb.DIALECT`) belong here; anything using syntax it can't
+# translate would fail, rather than measure some other query.
+SCENARIOS: dict[str, Callable[[random.Random, int], str]] = {
+    'get_leaderboard': lambda rng, users: (
+        '/gw_api/get_leaderboard?mode=std&mods=vn&sort=pp'
+        f'&page={rng.randint(1, max(users // 50, 1))}'
+    ),
+    'get_player_rank': lambda rng, users: (
+        '/gw_api/get_player_rank?mode=std&mods=vn'
+        f'&userid={rng.randint(2, users + 1)}'
+    ),
+    'get_player_scores': lambda rng, users: (
+        '/gw_api/get_player_scores?mode=std&mods=vn&sort=best&limit=5'
+        f'&id={rng.randint(2, users + 1)}'
+    ),
+    'get_player_most': lambda rng, users: (
+        '/gw_api/get_player_most?mode=std&mods=vn&limit=5'
+        f'&id={rng.randint(2, users + 1)}'
+    ),
+    'get_user_grade': lambda rng, users: (
+        '/gw_api/get_user_grade?mode=std&mods=vn'
+        f'&id={rng.randint(2, users + 1)}'
+    ),
+    'get_profile': lambda rng, users: (
+        '/gw_api/get_profile?mode=std&mods=vn&limit=5'
+        f'&id={rng.randint(2, users + 1)}'
+    )
+}
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * pct), len(samples) - 1)]
+
+
+async def run_scenario(client, pool: FakeSQLPool, name: str,
+                       concurrency: int, requests: int,
+                       users: int) -> dict[str, float]:
+    rng = random.Random(name)
+    urls = [SCENARIOS[name](rng, users) for _ in range(requests)]
+    latencies = []
+    errors = 0
+
+    async def worker(urls: list[str]) -> None:
+        nonlocal errors
+        for url in urls:
+            start = time.perf_counter()
+            resp = await client.get(url)
+            await resp.get_data()
+            latencies.append(time.perf_counter() - start)
+            errors += resp.status_code != 200
+
+    queries = pool.queries
+    start = time.perf_counter()
+    await asyncio.gather(*[worker(urls[i::concurrency])
+                           for i in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    return {
+        'requests': requests,
+        'errors': errors,
+        'concurrency': concurrency,
+        'throughput': requests / elapsed,
+        'mean': statistics.mean(latencies),
+        'p50': percentile(latencies, .50),
+        'p95': percentile(latencies, .95),
+        'p99': percentile(latencies, .99),
+        'queries_per_request': (pool.queries - queries) / requests
+    }
+
+
+async def run(args: argparse.Namespace) -> dict:
+    pool = FakeSQLPool()
+    seed(pool, args.users, args.maps, args.scores)
+
+    # the app's mysql hook will pick up our
+    # fake rather than connecting to mysql.
+    import main
+    main.RoutedSQLPool = lambda **kwargs: pool
+
+    # (the snapshot taken at startup shouldn't land in the real history.)
+    from objects import glob
+    glob.config.rank_history_path = tempfile.mkdtemp(prefix='rank_history')
+
+    results = {}
+    async with main.app.test_app() as test_app:
+        client = test_app.test_client()
+
+        for name in args.scenarios or SCENARIOS:
+            results[name] = await run_scenario(
+                client, pool, name, args.concurrency,
+                args.requests, args.users)
+            print(f'{name}: {results[name]["p50"] * 1000:.2f}ms p50, '
+                  f'{results[name]["throughput"]:.0f} req/s',
+                  file=sys.stderr)
+
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'commit': commit,
+        'users': args.users,
+        'scores_per_user': args.scores,
+        'results': results
+    }
+
+
+def compare(old_path: str, new_path: str) -> None:
+    with open(old_path, 'rb') as f:
+        old = orjson.loads(f.read())['results']
+    with open(new_path, 'rb') as f:
+        new = orjson.loads(f.read())['results']
+
+    for name in old.keys() & new.keys():
+        for stat in ('p50', 'p95', 'p99', 'throughput', 'queries_per_request'):
+            before, after = old[name][stat], new[name][stat]
+            change = (after - before) / before * 100 if before else 0.0
+            print(f'{name:<20} {stat:<20} {before:>12.5f} '
+                  f'{after:>12.5f} {change:>+8.1f}%')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--maps', type=int, default=2000)
+    parser.add_argument('--scores', type=int, default=50,
+                        help='scores per user, per scores table')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=2000,
+                        help='requests per scenario')
+    parser.add_argument('--scenario', dest='scenarios', action='append',
+                        choices=SCENARIOS)
+    parser.add_argument('--output', help='write results to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    output = orjson.dumps(asyncio.run(run(args)), option=orjson.OPT_INDENT_2)
+
+    if args.output:
+        with open(args.output, 'wb') as f:
+            f.write(output)
+    else:
+        sys.stdout.buffer.write(output + b'\n')
+
+
+if __name__ == '__main__':
+    main()
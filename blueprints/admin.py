@@ -3,17 +3,25 @@
 __all__ = ()
 
 import datetime
+import signal
 
 import timeago
 from quart import Blueprint
 from quart import render_template
+from quart import request
 from quart import session
 
 from objects import glob
+from objects import prefork
+from objects.database import read_from_replicas
 from objects.utils import flash
+from objects.utils import valid_csrf
 
 admin = Blueprint('admin', __name__)
 
+# the panel's reads can lag the primary a little.
+admin.before_request(read_from_replicas)
+
 
 @admin.route('/')
 @admin.route('/home')
@@ -26,24 +34,37 @@ async def home():
     if not session['user_data']['is_staff']:
         return await flash('error', f'You have insufficient privileges.', 'home')
 
-    # fetch data from database
-    dash_data = await glob.db.fetch(
-        'SELECT COUNT(id) count, '
-        '(SELECT name FROM users ORDER BY id DESC LIMIT 1) lastest_user, '
-        '(SELECT COUNT(id) FROM users WHERE NOT priv & 1) banned '
-        'FROM users'
-    )
+    # staff may ask for fresh numbers; otherwise
+    # we serve the last background snapshot.
+    if request.args.get('refresh', type=int):
+        await glob.dashboard.refresh(force=True)
 
-    recent_users = await glob.db.fetchall('SELECT * FROM users ORDER BY id DESC LIMIT 5')
-    recent_scores = await glob.db.fetchall(
-        'SELECT scores_vn.*, maps.artist, maps.title, '
-        'maps.set_id, maps.creator, maps.version '
-        'FROM scores_vn JOIN maps ON scores_vn.map_md5 = maps.md5 '
-        'ORDER BY scores_vn.id DESC LIMIT 5'
-    )
+    snapshot = glob.dashboard
 
     return await render_template(
-        'admin/home.html', dashdata=dash_data,
-        recentusers=recent_users, recentscores=recent_scores,
+        'admin/home.html', dashdata=snapshot.counts,
+        recentusers=snapshot.recent_users, recentscores=snapshot.recent_scores,
+        computed_at=datetime.datetime.fromtimestamp(snapshot.computed_at),
         datetime=datetime, timeago=timeago
     )
+
+
+@admin.route('/most_played/rebuild', methods=['POST'])  # POST
+async def rebuild_most_played():
+    """Rebuild every worker's most played map counts."""
+    if not 'authenticated' in session:
+        return await flash('error', 'Please login first.', 'login')
+
+    if not session['user_data']['is_staff']:
+        return await flash('error', f'You have insufficient privileges.', 'home')
+
+    form = await request.form
+    if not valid_csrf(form.get('csrf_token')):
+        return await flash('error', 'Your session has expired; please try again.', 'home')
+
+    if prefork.broadcast(signal.SIGUSR1):
+        return await flash('success', 'Rebuilding most played maps on every worker.', 'home')
+
+    # (e.g. under hypercorn's own workers, which we can't reach.)
+    return await flash('success', 'Rebuilding most played maps on this worker only; '
+                                  'serve with main.py --workers to rebuild them all.', 'home')
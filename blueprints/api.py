@@ -7,27 +7,55 @@
 
 __all__ = ()
 
+import asyncio
+import base64
+import binascii
+from typing import AsyncIterator
+from typing import Callable
+from typing import Optional
+from typing import Union
+
+import orjson
 from cmyui.logging import Ansi
 from cmyui.logging import log
 from quart import Blueprint
-from quart import jsonify
 from quart import request
 
 from objects import glob
 from objects import utils
+from objects.cache import cached
+from objects.cache import http_cache
+from objects.database import read_from_replicas
+from objects.grades import count_grades
+from objects.leaderboards import LEADERBOARD_PAGE_SIZE
+from objects.leaderboards import fetch_leaderboard
+from objects.leaderboards import fetch_leaderboard_total
+from objects.responses import json_response
+from objects.responses import stream_json
 
 api = Blueprint('api', __name__)
 
+# the api's reads can lag the primary a little.
+api.before_request(read_from_replicas)
+
 """ valid modes, mods, sorts """
 valid_modes = frozenset({'std', 'taiko', 'catch', 'mania'})
 valid_mods = frozenset({'vn', 'rx', 'ap'})
 valid_sorts = frozenset({'tscore', 'rscore', 'pp', 'plays',
                          'playtime', 'acc', 'max_combo'})
 
+
+def scores_version(default_mods: str = 'vn') -> Callable[[], int]:
+    """A data version for routes derived only from a player's scores:
+    the watermark of the scores table they read from."""
+    return lambda: glob.watermarks.get(request.args.get('mods', default_mods))
+
+
 """/get_player_rank"""
 
 
 @api.route('/get_player_rank')  # GET
+@http_cache(max_age=30, stale_while_revalidate=60)
 async def api_get_player_rank():
     """Return the ranking of a given player."""
 
@@ -50,30 +78,12 @@ async def api_get_player_rank():
     sql_0 = utils.mode_mods_to_int(
         f"{request.args.get('mods')}_{request.args.get('mode')}")
 
-    q = [
-        "SELECT u.id user_id, pp FROM stats",
-        "JOIN users u ON stats.id=u.id",
-        f"WHERE mode={sql_0}",
-        "AND u.priv >= 3"
-    ]
-
-    if 'country' in request.args:
-        q.append(f"AND country='{request.args.get('country')}'")
-
-    q.append("ORDER BY pp DESC")
-
-    q = ' '.join(q)  # join all the query parts together as a single string
-
-    output = await glob.db.fetchall(q)
-
-    rank = 1
-    for i in range(len(output)):  # loop through ids in order of pp
-        if output[i]['user_id'] == int(request.args.get('userid')):
-            break
-        rank += 1  # increment rank
+    rank = await glob.ranks.fetch_rank(
+        sql_0, int(request.args.get('userid')),
+        request.args.get('country'))
 
     # return player rank
-    return jsonify({
+    return json_response({
         "status": "success",
         "rank": rank
     })
@@ -82,15 +92,55 @@ async def api_get_player_rank():
 """ /get_leaderboard """
 
 
+def encode_cursor(sort_by: str, mode: int, country: Optional[str],
+                  sort_value: Union[int, float], user_id: int) -> str:
+    """Encode the last row of a leaderboard page as an opaque cursor,
+    along with the leaderboard (sort, mode & country) it's a row of."""
+    data = orjson.dumps([sort_by, mode, country, sort_value, user_id],
+                        default=float)
+    return base64.urlsafe_b64encode(data).decode()
+
+
+def decode_cursor(cursor: str, sort_by: str, mode: int,
+                  country: Optional[str]
+                  ) -> Optional[tuple[Union[int, float], int]]:
+    """Decode a cursor from `encode_cursor`; `None` if it's malformed,
+    or belongs to a different leaderboard than the one requested."""
+    try:
+        (cursor_sort, cursor_mode, cursor_country,
+         sort_value, user_id) = orjson.loads(base64.urlsafe_b64decode(cursor))
+    except (ValueError, TypeError, binascii.Error):
+        return None
+
+    if (cursor_sort, cursor_mode, cursor_country) != (sort_by, mode, country):
+        return None
+
+    if (
+        not isinstance(sort_value, (int, float)) or
+        not isinstance(user_id, int)
+    ):
+        return None
+
+    return sort_value, user_id
+
+
 @api.route('/get_leaderboard')  # GET
+@http_cache(max_age=30, stale_while_revalidate=60)
+@cached('mode', 'mods', 'sort', 'country', 'page', 'cursor')
 async def get_leaderboard():
-    """Return the leaderboard."""
+    """Return the leaderboard.
+
+    Pages may be selected either by number (`page`), or by the
+    opaque `cursor` returned alongside the previous page; the
+    latter seeks straight to the next rows, so deep pages cost
+    about as much as the first."""
 
     mode = request.args.get('mode', default='std', type=str)
     mods = request.args.get('mods', default='vn', type=str)
     sort_by = request.args.get('sort', default='pp', type=str)
     country = request.args.get('country', default=None, type=str)
     page = request.args.get('page', default=1, type=int)
+    cursor = request.args.get('cursor', default=None, type=str)
 
     if mode not in valid_modes:
         return b'invalid mode! (std, taiko, catch, mania)'
@@ -104,59 +154,85 @@ async def get_leaderboard():
     if sort_by not in valid_sorts:
         return b'invalid sort param!'
 
-    sql_0 = utils.mode_mods_to_int(f"{mods}_{mode}")
-
-    q = ['SELECT u.id user_id, u.name username, tscore,',
-         'rscore, pp, plays, playtime, acc, max_combo',
-         'FROM stats JOIN users u ON stats.id = u.id',
-         f'WHERE mode = {sql_0} AND u.priv >=3 AND {sort_by} > 0']
-
-    # TODO: maybe cache the top X scores in the db to get a
-    # rough estimate on what is a ridiculous page for a request?
-    # (and then cache that number in the db)
-
-    if country is not None:
-        q.append(f'AND country = {country}')
+    if page < 1:
+        return b'invalid page!'
 
-    q.append(f'ORDER BY {sort_by} DESC')
-    q.append(f'LIMIT {page * 50} OFFSET {(page - 1) * 50}')
+    sql_0 = utils.mode_mods_to_int(f"{mods}_{mode}")
 
-    if glob.config.debug:  # log extra info if in debug mode
-        log(' '.join(q), Ansi.LMAGENTA)
+    if (
+        cursor is not None and
+        (cursor := decode_cursor(cursor, sort_by, sql_0, country)) is None
+    ):
+        return b'invalid cursor!'
 
     # fetch 50 rows
-    output = await glob.db.fetchall(' '.join(q))
+    output = await fetch_leaderboard(sql_0, sort_by, country, page, cursor)
+    total = await fetch_leaderboard_total(sql_0, sort_by, country)
 
     # build the response
     response = {
         'status': 'success',
-        'page': page,
-        'total_pages': (len(output) // 50) + 1,
-        'results': [],
+        # a cursor seeks by row, so has no page number.
+        'page': page if cursor is None else None,
+        'total_pages': -(-total // LEADERBOARD_PAGE_SIZE),
+        'next_cursor': None,
+        # rows are already projected to exactly the
+        # fields we return, so they're served as-is.
+        'results': output,
     }
 
-    # build the results
-    for i in output:
-        response['results'].append({
-            'user_id': output[i]['user_id'],
-            'username': output[i]['username'],
-            'tscore': output[i]['tscore'],
-            'rscore': output[i]['rscore'],
-            'pp': output[i]['pp'],
-            'plays': output[i]['plays'],
-            'playtime': output[i]['playtime'],
-            'acc': output[i]['acc'],
-            'max_combo': output[i]['max_combo']
-        })
+    if len(output) == LEADERBOARD_PAGE_SIZE:
+        response['next_cursor'] = encode_cursor(
+            sort_by, sql_0, country, output[-1][sort_by], output[-1]['user_id'])
 
     # return the response
-    return jsonify(response) if response else b'{}'
+    return json_response(response)
 
 
 """ /get_user_info """
 
 
+async def fetch_user_info(mode: int, id: Optional[int] = None,
+                          name: Optional[str] = None) -> tuple[dict, dict]:
+    """Fetch a user's info & stats, and their achievements."""
+    q = [
+        "SELECT u.id user_id, u.name username, u.safe_name username_safe, u.country, u.priv privileges,",
+        "u.silence_end, u.donor_end, u.creation_time, u.latest_activity, u.clan_id, u.clan_priv,",
+        "tscore, rscore, pp, plays, playtime, acc, max_combo",
+        "FROM stats JOIN users u ON stats.id = u.id",
+    ]
+
+    # achivement
+    q2 = [
+        "SELECT userid, achid FROM user_achievements ua",
+        "INNER JOIN users u ON u.id = ua.userid",
+    ]
+
+    # append request arguments (id or name)
+    if id:
+        q.append('WHERE u.id = %s')
+        q2.append('WHERE u.id = %s')
+        args = [id]
+    else:
+        q.append('WHERE u.safe_name = %s')
+        q2.append('WHERE u.safe_name = %s')
+        args = [name]
+
+    q.append('AND mode = %s AND u.priv >= 3')
+    q2.append('ORDER BY ua.achid ASC')
+
+    if glob.config.debug:
+        log(' '.join(q), Ansi.LMAGENTA)
+        log(' '.join(q2), Ansi.LMAGENTA)
+
+    return await asyncio.gather(
+        glob.db.fetch(' '.join(q), args + [mode]),
+        glob.db.fetch(' '.join(q2), args)
+    )
+
+
 @api.route('/get_user_info')  # GET
+@http_cache(max_age=10, stale_while_revalidate=30)
 async def get_user_info():
     """Return user info."""
 
@@ -174,56 +250,178 @@ async def get_user_info():
 
     sql_0 = utils.mode_mods_to_int(f"{mods}_{mode}")
 
-    # arguments
-    args0 = []
-    args1 = []
+    res, res_ach = await fetch_user_info(sql_0, id, name)
 
-    # append mode
-    args0.append(f"{sql_0}")
+    return json_response(userdata=res, achivement=res_ach) if res else b'{}'
 
-    # get the user info from the db
-    q = [
-        "SELECT u.id user_id, u.name username, u.safe_name username_safe, u.country, u.priv privileges,",
-        "u.silence_end, u.donor_end, u.creation_time, u.latest_activity, u.clan_id, u.clan_priv,",
-        "tscore, rscore, pp, plays, playtime, acc, max_combo",
-        "FROM stats JOIN users u ON stats.id = u.id",
-    ]
 
-    # achivement
-    q2 = [
-        "SELECT userid, achid FROM user_achievements ua",
-        "INNER JOIN users u ON u.id = ua.userid",
-    ]
+""" /search_players """
 
-    # append request arguments (id or name)
-    if id and type(id) == "int":
-        q.append(f'WHERE u.id = %s')
-        q2.append(f'WHERE u.id = %s')
-        args0.append(id)
-        args1.append(id)
-    elif name:
-        q.append('WHERE u.safe_name = %s')
-        q2.append('WHERE u.safe_name = %s')
-        args0.append(name)
-        args1.append(name)
 
-    q.append('AND mode=%s AND u.priv >= 3')
-    q2.append('ORDER BY ua.achid ASC')
+# a single character matches too many players to rank quickly.
+SEARCH_MIN_LENGTH = 2
+SEARCH_MAX_RESULTS = 50
 
-    if glob.config.debug:
-        log(' '.join(q), Ansi.LMAGENTA)
-        log(' '.join(q2), Ansi.LMAGENTA)
 
-    res = await glob.db.fetch(' '.join(q), args0)
-    res_ach = await glob.db.fetch(' '.join(q2), args1)
+@api.route('/search_players')  # GET
+@http_cache(max_age=30, stale_while_revalidate=60)
+async def search_players():
+    """Return the players whose names start with, or
+    contain, the query; ranked by pp in a given mode."""
+
+    query = request.args.get('q', default='', type=str).strip()
+    mode = request.args.get('mode', default='std', type=str)
+    mods = request.args.get('mods', default='vn', type=str)
+    limit = request.args.get('limit', default=10, type=int)
+
+    if len(query) < SEARCH_MIN_LENGTH:
+        return b'query too short!'
+
+    if mode not in valid_modes:
+        return b'invalid mode! (std, taiko, catch, mania)'
+
+    if mods not in valid_mods:
+        return b'invalid mods! (vn, rx, ap)'
+
+    if not 1 <= limit <= SEARCH_MAX_RESULTS:
+        return b'invalid limit!'
+
+    sql_0 = utils.mode_mods_to_int(f"{mods}_{mode}")
+
+    return json_response({
+        'status': 'success',
+        'results': glob.players.search(query, sql_0, limit)
+    })
+
+
+""" /get_rank_history """
+
+
+@api.route('/get_rank_history')  # GET
+@http_cache(max_age=3600, version=lambda: glob.rank_history.last_day)
+async def get_rank_history():
+    """Return a player's daily global & country ranks."""
+
+    id = request.args.get('id', type=int)
+    mode = request.args.get('mode', default='std', type=str)
+    mods = request.args.get('mods', default='vn', type=str)
+    days = request.args.get('days', default=90, type=int)
+
+    if not id:
+        return b'missing parameters! (id)'
+
+    if mode not in valid_modes:
+        return b'invalid mode! (std, taiko, catch, mania)'
 
-    return jsonify(userdata=res, achivement=res_ach) if res else b'{}'
+    if mods not in valid_mods:
+        return b'invalid mods! (vn, rx, ap)'
+
+    if not 1 <= days <= glob.config.rank_history_days:
+        return b'invalid days!'
+
+    sql_0 = utils.mode_mods_to_int(f"{mods}_{mode}")
+
+    return json_response({
+        'status': 'success',
+        'history': await glob.rank_history.fetch(sql_0, id, days)
+    })
 
 
 """ /get_player_scores """
 
 
+# scores are fetched (and streamed) in batches of at most this many.
+SCORE_BATCH_SIZE = 500
+
+SCORE_COLUMNS = ('id', 'map_md5', 'score', 'pp', 'acc', 'max_combo',
+                 'mods', 'n300', 'n100', 'n50', 'nmiss', 'ngeki', 'nkatu',
+                 'grade', 'status', 'mode', 'play_time', 'time_elapsed',
+                 'perfect')
+
+# map columns which share a name with a score's
+# column are returned prefixed with `map_`.
+MAP_RENAMES = {'id': 'map_id', 'status': 'map_status',
+               'max_combo': 'map_max_combo', 'mode': 'map_mode',
+               'md5': 'map_md5'}
+
+
+async def fetch_score_count(id: int, mode: int, mods: str, sort: str) -> int:
+    """Return a player's (cached) number of best or recent scores."""
+    async def count() -> int:
+        q = [f'SELECT COUNT(*) AS result FROM scores_{mods}',
+             'WHERE userid = %s AND mode = %s']
+        if sort == 'pp':
+            q.append('AND status = 2')
+
+        return (await glob.db.fetch(' '.join(q), [id, mode]))['result']
+
+    return await glob.responses.get_or_set(
+        ('score_count', id, mode, mods, sort), count,
+        ttl=glob.config.score_count_ttl,
+        cacheable=lambda count: count is not None)
+
+
+async def iter_player_scores(id: int, mode: int, mods: str,
+                             sort: str, limit: int) -> AsyncIterator[dict]:
+    """Yield up to `limit` of a player's best (`pp`) or recent (`id`)
+    scores on ranked maps, in batches of at most `SCORE_BATCH_SIZE`.
+
+    Scores are fetched without joining `maps`, and enriched from
+    the beatmap cache; since only ranked maps are shown, we fetch
+    more rows (seeking past the last) until we've enough of them."""
+    q = [f'SELECT {", ".join(SCORE_COLUMNS)} FROM scores_{mods}',
+         'WHERE userid = %s AND mode = %s']
+    if sort == 'pp':
+        q.append('AND status = 2')
+
+    found = 0
+    last = None
+    batch_size = min(limit, SCORE_BATCH_SIZE)
+
+    while found < limit:
+        batch_q = q.copy()
+        args = [id, mode]
+
+        if last is not None:
+            batch_q.append(f'AND ({sort} < %s OR ({sort} = %s AND id < %s))')
+            args.extend((last[sort], last[sort], last['id']))
+
+        batch_q.append(f'ORDER BY {sort} DESC, id DESC LIMIT {batch_size}')
+
+        if glob.config.debug:
+            log(' '.join(batch_q), Ansi.LMAGENTA)
+
+        if not (batch := await glob.db.fetchall(' '.join(batch_q), args)):
+            break
+
+        maps = await glob.beatmaps.get_many(row['map_md5'] for row in batch)
+
+        for row in batch:
+            if (bmap := maps.get(row['map_md5'])) and bmap['status'] == 2:
+                yield row | {MAP_RENAMES.get(k, k): v for k, v in bmap.items()}
+
+                if (found := found + 1) == limit:
+                    return
+
+        if len(batch) < batch_size:
+            break  # no more scores
+
+        last = batch[-1]
+        batch_size = min(batch_size * 2, SCORE_BATCH_SIZE)
+
+
+async def fetch_player_scores(id: int, mode: int, mods: str,
+                              sort: str, limit: int) -> tuple[list, int]:
+    """Fetch a player's best (`pp`) or recent (`id`) scores on
+    ranked maps, along with their total number of matching scores."""
+    scores = [score async for score in
+              iter_player_scores(id, mode, mods, sort, limit)]
+    count = await fetch_score_count(id, mode, mods, sort)
+    return scores, count
+
+
 @api.route('/get_player_scores')  # GET
+@http_cache(max_age=10, stale_while_revalidate=30, version=scores_version())
 async def get_player_scores():
     # get request args
     id = request.args.get('id', type=int)
@@ -252,39 +450,37 @@ async def get_player_scores():
     if not limit:
         limit = 50
 
-    # fetch scores
-    q = [f'SELECT scores_{mods}.*, maps.* '
-         f'FROM scores_{mods} JOIN maps ON scores_{mods}.map_md5 = maps.md5']
-    q2 = [f'SELECT COUNT(scores_{mods}.id) AS result '
-          f'FROM scores_{mods} JOIN maps ON scores_{mods}.map_md5 = maps.md5']
+    # scores are streamed, as `limit` may be large.
+    count = await fetch_score_count(id, mode, mods, sort)
+    return await stream_json('scores',
+                             iter_player_scores(id, mode, mods, sort, limit),
+                             limit=count)
 
-    # argumnts
-    args = []
 
-    q.append(f'WHERE scores_{mods}.userid = %s '
-             f'AND scores_{mods}.mode = {mode} '
-             f'AND maps.status = 2')
-    q2.append(f'WHERE scores_{mods}.userid = %s '
-              f'AND scores_{mods}.mode = {mode}')
-    if sort == 'pp':
-        q.append(f'AND scores_{mods}.status = 2')
-        q2.append(f'AND scores_{mods}.status = 2')
-    q.append(f'ORDER BY scores_{mods}.{sort} DESC '
-             f'LIMIT {limit}')
-    args.append(id)
+""" /get_player_most """
 
-    if glob.config.debug:
-        log(' '.join(q), Ansi.LMAGENTA)
-        log(' '.join(q2), Ansi.LMAGENTA)
-    res = await glob.db.fetchall(' '.join(q), args)
-    limit = await glob.db.fetch(' '.join(q2), args)
-    return jsonify(scores=res, limit=limit['result']) if res else jsonify(scores=[], limit=limit['result'])
 
+async def fetch_player_most(id: int, mode: int, mods: str,
+                            limit: int) -> list:
+    """Fetch a player's most played maps."""
+    if not (top := await glob.most_played.top(id, mode, mods, limit)):
+        return []
 
-""" /get_player_most """
+    maps = await glob.beatmaps.get_many(md5 for md5, _ in top)
+
+    return [{
+        'mode': mode,
+        'map_md5': md5,
+        'artist': maps[md5]['artist'],
+        'title': maps[md5]['title'],
+        'set_id': maps[md5]['set_id'],
+        'creator': maps[md5]['creator'],
+        'count': count
+    } for md5, count in top if md5 in maps]
 
 
 @api.route('/get_player_most')  # GET
+@http_cache(max_age=10, stale_while_revalidate=30, version=scores_version())
 async def get_player_most():
     # get request args
     id = request.args.get('id', type=int)
@@ -305,27 +501,22 @@ async def get_player_most():
     if not limit:
         limit = 50
 
-    # fetch scores
-    q = [
-        f'SELECT scores_{mods}.mode, scores_{mods}.map_md5, maps.artist, maps.title, maps.set_id, maps.creator, COUNT(*) AS `count` '
-        f'FROM scores_{mods} JOIN maps ON scores_{mods}.map_md5 = maps.md5']
+    return json_response(maps=await fetch_player_most(id, mode, mods, limit))
 
-    # argumnts
-    args = []
 
-    q.append(
-        f'WHERE userid = %s AND scores_{mods}.mode = {mode} GROUP BY map_md5')
-    q.append(f'ORDER BY COUNT DESC '
-             f'LIMIT {limit}')
-    args.append(id)
+""" /get_user_grade """
 
-    if glob.config.debug:
-        log(' '.join(q), Ansi.LMAGENTA)
-    res = await glob.db.fetchall(' '.join(q), args)
-    return jsonify(maps=res) if res else jsonify(maps=[])
+
+async def fetch_user_grades(id: int, mode: int, mods: str) -> dict[str, int]:
+    """Fetch the number of x/xh/s/sh/a grades a player has."""
+    if glob.config.grade_cache:
+        return await glob.grades.get(id, mode, mods)
+
+    return await count_grades(id, mode, mods)
 
 
 @api.route('/get_user_grade')  # GET
+@http_cache(max_age=10, stale_while_revalidate=30, version=scores_version('rx'))
 async def get_user_grade():
     # get request stuff
     mode = request.args.get('mode', default='std', type=str)
@@ -343,27 +534,80 @@ async def get_user_grade():
     if not id:
         return b'missing id!'
 
-    # get all scores
-    q = f'SELECT grade FROM scores_{mods} WHERE mode = {mode} AND userid = %s'
+    # return
+    return json_response(await fetch_user_grades(id, mode, mods))
 
-    scores = await glob.db.fetchall(q, [id])
 
-    grades = {
-        "x": 0,
-        "xh": 0,
-        "s": 0,
-        "sh": 0,
-        "a": 0
-    }
+""" /get_profile """
 
-    if not scores:
-        return jsonify(grades)
+profile_sections = frozenset({'info', 'grades', 'rank',
+                              'best', 'recent', 'most'})
 
-    # count
-    for score in (x for x in scores if x['grade'].lower() in grades):
-        grades[score['grade'].lower()] += 1
 
-    if glob.config.debug:
-        log(q, Ansi.LMAGENTA)
-    # return
-    return jsonify(grades)
+@api.route('/get_profile')  # GET
+@http_cache(max_age=10, stale_while_revalidate=30)
+async def get_profile():
+    """Return every section of a player's profile in one response.
+
+    The sections are fetched concurrently; `sections` may be
+    given as a comma-separated subset of `profile_sections`."""
+
+    # get request args
+    id = request.args.get('id', type=int)
+    mode = request.args.get('mode', default='std', type=str)
+    mods = request.args.get('mods', default='vn', type=str)
+    limit = request.args.get('limit', default=5, type=int)
+    sections = request.args.get('sections', type=str)
+
+    # check if required parameters are met
+    if not id:
+        return b'missing parameters! (id)'
+
+    if mods not in valid_mods:
+        return b'invalid mods! (vn, rx, ap)'
+
+    if (mode_int := utils.convert_mode_int(mode)) is None:
+        return b'invalid mode type! (std, taiko, catch, mania)'
+
+    if sections is None:
+        sections = profile_sections
+    elif not (sections := frozenset(sections.split(','))) <= profile_sections:
+        return b'invalid sections! (info, grades, rank, best, recent, most)'
+
+    sql_0 = utils.mode_mods_to_int(f"{mods}_{mode}")
+
+    async def fetch_info() -> dict:
+        res, res_ach = await fetch_user_info(sql_0, id)
+        return {'userdata': res, 'achivement': res_ach}
+
+    async def fetch_rank() -> dict:
+        if (entry := glob.ranks.players.get((sql_0, id))):
+            country = entry[1]
+        else:
+            country = (await glob.db.fetch(
+                'SELECT country FROM users WHERE id = %s', [id]
+            ) or {}).get('country')
+
+        global_rank, country_rank = await asyncio.gather(
+            glob.ranks.fetch_rank(sql_0, id),
+            glob.ranks.fetch_rank(sql_0, id, country)
+        )
+        return {'global': global_rank, 'country': country_rank}
+
+    async def fetch_scores(sort: str) -> dict:
+        res, count = await fetch_player_scores(id, mode_int, mods, sort, limit)
+        return {'scores': res, 'limit': count}
+
+    fetchers = {
+        'info': fetch_info,
+        'grades': lambda: fetch_user_grades(id, mode_int, mods),
+        'rank': fetch_rank,
+        'best': lambda: fetch_scores('pp'),
+        'recent': lambda: fetch_scores('id'),
+        'most': lambda: fetch_player_most(id, mode_int, mods, limit)
+    }
+
+    names = [name for name in fetchers if name in sections]
+    results = await asyncio.gather(*[fetchers[name]() for name in names])
+
+    return json_response(dict(zip(names, results)))
@@ -2,35 +2,37 @@
 
 __all__ = ()
 
-import asyncio
-import bcrypt
 import hashlib
-import aiofiles.os
-import os
 import time
-import markdown2
+from typing import Optional
+from typing import Union
+
 import requests
 import patreon
 
 from cmyui.logging import Ansi
 from cmyui.logging import log
 from quart import Blueprint
+from quart import make_response
 from quart import redirect
 from quart import render_template
 from quart import request
 from quart import session
 
-from PIL import Image
-from resizeimage import resizeimage
-
 from constants import regexes
 from objects import glob
+from objects import images
+from objects import leaderboards
 from objects import utils
+from objects.database import pin_to_primary
+from objects.database import read_from_replicas
+from objects.pages import render_page
 from objects.privileges import Privileges
 from objects.utils import flash
 
 VALID_MODES = frozenset({'std', 'taiko', 'catch', 'mania'})
 VALID_MODS = frozenset({'vn', 'rx', 'ap'})
+LEADERBOARD_SORTS = frozenset({'pp', 'rscore'})
 
 frontend = Blueprint('frontend', __name__)
 
@@ -38,7 +40,12 @@ frontend = Blueprint('frontend', __name__)
 @frontend.route('/home')
 @frontend.route('/')
 async def home():
-    return await render_template('home.html')
+    return await render_page('home.html')
+
+
+@frontend.route('/faq')
+async def faq():
+    return await render_page('faq.html')
 
 
 @frontend.route('/settings')
@@ -102,6 +109,7 @@ async def settings_profile_post():
             [new_name, utils.get_safe_name(new_name),
              session['user_data']['id']]
         )
+        glob.players.rename(session['user_data']['id'], new_name)
 
     if new_email != old_email:
         # Emails must:
@@ -121,12 +129,33 @@ async def settings_profile_post():
             [new_email, session['user_data']['id']]
         )
 
+    # read back our changes from the primary.
+    pin_to_primary()
+
     # logout
     session.pop('authenticated', None)
     session.pop('user_data', None)
     return await flash('success', 'Your username/email have been changed! Please login again.', 'login')
 
 
+def _image_size(sizes: tuple[tuple[int, int], ...]) -> Optional[str]:
+    """The `?size=WxH` requested, if it's one we store (other than the first)."""
+    if (size := request.args.get('size')) is None:
+        return None
+
+    return size if size in {f'{w}x{h}' for w, h in sizes[1:]} else None
+
+
+@frontend.route('/a/<int:id>')
+async def avatar(id: int):
+    return await glob.avatars.serve(id, _image_size(glob.config.avatar_sizes))
+
+
+@frontend.route('/b/<int:id>')
+async def banner(id: int):
+    return await glob.banners.serve(id, _image_size(glob.config.banner_sizes))
+
+
 @frontend.route('/settings/avatar')
 async def settings_avatar():
     if 'authenticated' not in session:
@@ -141,32 +170,25 @@ async def settings_avatar_post():
         return await flash('error', 'You must be logged in to access avatar settings!', 'login')
 
     APATH = f'{glob.config.path_to_gulag}.data/avatars'
-    EXTENSIONS = [".png", ".jpg", ".jpeg"]
-
-    if session['user_data']['is_donator'] or session['user_data']['is_staff']:
-        EXTENSIONS.append(".gif")
 
     files = await request.files
 
-    avatar_file = (files.get('avatar'))
-    ava = (os.path.splitext(avatar_file.filename.lower()))[1]
-    avatar_dir = f"{APATH}/{session['user_data']['id']}{ava}"
+    if (avatar_file := files.get('avatar')) is None:
+        return await flash('error', 'Please select an image to upload.', 'settings/avatar')
+
+    # supporters & staff may use (animated) gifs.
+    allow_gif = bool(session['user_data']['is_donator'] or session['user_data']['is_staff'])
 
-    if ava not in EXTENSIONS:
+    # the image is validated by decoding it, rather
+    # than by trusting the extension we're given.
+    try:
+        await images.save_upload(avatar_file.read(), APATH, str(session['user_data']['id']),
+                                 glob.config.avatar_sizes, allow_gif)
+    except images.InvalidImage:
         return await flash('error', 'Please submit an image which is either a png, jpg, jpeg! Supporters can use gifs!',
                            'settings/avatar')
 
-    for old_ava in EXTENSIONS:
-        old_dir = f"{APATH}/{session['user_data']['id']}{old_ava}"
-        if os.path.isfile(old_dir):
-            await aiofiles.os.remove(old_dir)
-
-    await avatar_file.save(avatar_dir)
-    # img = Image.open(avatar_dir)
-    # width, height = img.size
-    # if width > 256 or height > 256:
-    #    new = resizeimage.resize_cover(img, [256, 256])
-    #    new.save(avatar_dir, img.format)
+    glob.avatars.invalidate(session['user_data']['id'])
 
     return await flash('success', 'Your avatar has been successfully changed!', 'settings/avatar')
 
@@ -193,31 +215,24 @@ async def settings_banner_post():
         return await flash('error', 'You must be logged in to access banner settings!', 'login')
 
     BPATH = f'{glob.config.path_to_gulag}.data/banners'
-    EXTENSIONS = [".gif", ".png", ".jpg", ".jpeg"]
 
     files = await request.files
-    banner_file = (files.get('banner'))
 
-    # construct banner file path and extension
-    banner = (os.path.splitext(banner_file.filename.lower()))[1]
+    if (banner_file := files.get('banner')) is None:
+        return await flash('error', 'Please select an image to upload.', 'settings/banner')
 
-    banner_dir = f"{BPATH}/{session['user_data']['id']}{banner}"
+    # supporters & staff may use (animated) gifs.
+    allow_gif = bool(session['user_data']['is_donator'] or session['user_data']['is_staff'])
 
-    if banner not in EXTENSIONS:
-        return await flash('error', 'Please submit an image which is either a png, jpg, or gif!', 'settings/banner')
+    try:
+        await images.save_upload(banner_file.read(), BPATH, str(session['user_data']['id']),
+                                 glob.config.banner_sizes, allow_gif)
+    except images.InvalidImage:
+        return await flash('error', 'Please submit an image which is either a png, jpg, jpeg! Supporters can use gifs!',
+                           'settings/banner')
 
-    # remove any old banners
-    for old_banner in EXTENSIONS:
-        old_dir = f"{BPATH}/{session['user_data']['id']}{old_banner}"
-        if os.path.isfile(old_dir):
-            await aiofiles.os.remove(old_dir)  # remove old banner
+    glob.banners.invalidate(session['user_data']['id'])
 
-    await banner_file.save(banner_dir)
-    # img = Image.open(banner_dir)
-    # width, height = img.size
-    # if width > 1140 or height > 215:
-    #    new = resizeimage.resize_cover(img, [1140, 215])
-    #    new.save(banner_dir, img.format)
     return await flash('success', 'Your banner has been successfully changed!', 'settings/banner')
 
 
@@ -273,27 +288,26 @@ async def settings_password_post():
 
     # check old password against db
     # intentionally slow, will cache to speed up
-    if pw_bcrypt in bcrypt_cache:
-        if pw_md5 != bcrypt_cache[pw_bcrypt]:  # ~0.1ms
+    if (cached := await bcrypt_cache.verify(pw_bcrypt, pw_md5)) is not None:
+        if not cached:  # ~0.1ms
             if glob.config.debug:
                 log(f"{session['user_data']['name']}'s change pw failed - pw incorrect.", Ansi.LYELLOW)
             return await flash('error', 'Your old password is incorrect.', 'settings/password')
     else:  # ~200ms
-        if not bcrypt.checkpw(pw_md5, pw_bcrypt):
+        if not await glob.hasher.checkpw(pw_md5, pw_bcrypt):
             if glob.config.debug:
                 log(f"{session['user_data']['name']}'s change pw failed - pw incorrect.", Ansi.LYELLOW)
             return await flash('error', 'Your old password is incorrect.', 'settings/password')
 
     # remove old password from cache
-    if pw_bcrypt in bcrypt_cache:
-        del bcrypt_cache[pw_bcrypt]
+    await bcrypt_cache.remove(pw_bcrypt)
 
     # calculate new md5 & bcrypt pw
     pw_md5 = hashlib.md5(new_password.encode()).hexdigest().encode()
-    pw_bcrypt = bcrypt.hashpw(pw_md5, bcrypt.gensalt())
+    pw_bcrypt = await glob.hasher.hashpw(pw_md5)
 
     # update password in cache and db
-    bcrypt_cache[pw_bcrypt] = pw_md5
+    await bcrypt_cache.set(pw_bcrypt, pw_md5)
     await glob.db.execute(
         'UPDATE users '
         'SET pw_bcrypt = %s '
@@ -301,6 +315,8 @@ async def settings_password_post():
         [pw_bcrypt, utils.get_safe_name(session['user_data']['name'])]
     )
 
+    pin_to_primary()
+
     # logout
     session.pop('authenticated', None)
     session.pop('user_data', None)
@@ -345,13 +361,80 @@ async def profile(id):
 @frontend.route('/leaderboard')
 @frontend.route('/lb')
 async def leaderboard_no_data():
-    return await render_template('leaderboard.html', mode='std', sort='pp', mods='vn')
+    return await leaderboard('std', 'pp', 'vn')
+
+
+@frontend.app_template_filter()
+def commas(num: Union[int, float]) -> str:
+    return f'{num:,}'
+
+
+@frontend.app_template_filter()
+def score_format(score: int) -> str:
+    if score > 1000 * 1000 * 1000:
+        return f'{score / 1000000000:,.2f} billion'
+    if score > 1000 * 1000:
+        return f'{score / 1000000:,.2f} million'
+    return f'{score:,}'
+
+
+async def render_leaderboard_table(mode: str, sort: str, mods: str,
+                                   page: int) -> str:
+    """Render (or fetch the cached render of) a leaderboard page's table.
+
+    Where the cache can't hold the render (a 50 row table is larger
+    than a shared memory backend's slot), its rows are cached instead."""
+    mode_int = utils.mode_mods_to_int(f'{mods}_{mode}')
+    key = ('leaderboard_table', mode, sort, mods, page)
+    rows_key = ('leaderboard_rows', mode_int, sort, page)
+    ttl = glob.config.leaderboard_table_ttl
+
+    async def render() -> str:
+        if (table := await glob.responses.get(rows_key)) is None:
+            table = {
+                'rows': await leaderboards.fetch_leaderboard(mode_int, sort, page=page),
+                'total': await leaderboards.fetch_leaderboard_total(mode_int, sort)
+            }
+
+        html = await render_template(
+            'components/leaderboard_table.html', rows=table['rows'],
+            mode=mode, sort=sort, mods=mods, page=page,
+            offset=(page - 1) * leaderboards.LEADERBOARD_PAGE_SIZE,
+            total_pages=-(-table['total'] // leaderboards.LEADERBOARD_PAGE_SIZE)
+        )
+
+        if not glob.responses.fits(key, html):
+            await glob.responses.set(rows_key, table, ttl)
+
+        return html
+
+    return await glob.responses.get_or_set(
+        key, render, ttl, cacheable=lambda html: glob.responses.fits(key, html))
 
 
 @frontend.route('/leaderboard/<mode>/<sort>/<mods>')
 @frontend.route('/lb/<mode>/<sort>/<mods>')
 async def leaderboard(mode, sort, mods):
-    return await render_template('leaderboard.html', mode=mode, sort=sort, mods=mods)
+    if not glob.config.leaderboard_ssr:
+        # an empty shell; leaderboard.js fetches the rows.
+        return await render_template('leaderboard.html', mode=mode, sort=sort, mods=mods)
+
+    page = request.args.get('page', default=1, type=int)
+
+    if (
+        mode not in VALID_MODES or
+        mods not in VALID_MODS or
+        sort not in LEADERBOARD_SORTS or
+        page < 1
+    ):
+        return await render_template('404.html'), 404
+
+    # the leaderboard can lag the primary a little.
+    read_from_replicas()
+    fragment = await render_leaderboard_table(mode, sort, mods, page)
+
+    return await render_template('leaderboard.html', mode=mode, sort=sort,
+                                 mods=mods, fragment=fragment)
 
 
 @frontend.route('/login')
@@ -399,19 +482,19 @@ async def login_post():
 
     # check credentials (password) against db
     # intentionally slow, will cache to speed up
-    if pw_bcrypt in bcrypt_cache:
-        if pw_md5 != bcrypt_cache[pw_bcrypt]:  # ~0.1ms
+    if (cached := await bcrypt_cache.verify(pw_bcrypt, pw_md5)) is not None:
+        if not cached:  # ~0.1ms
             if glob.config.debug:
                 log(f"{username}'s login failed - pw incorrect.", Ansi.LYELLOW)
             return await flash('error', 'Password is incorrect.', 'login')
     else:  # ~200ms
-        if not bcrypt.checkpw(pw_md5, pw_bcrypt):
+        if not await glob.hasher.checkpw(pw_md5, pw_bcrypt):
             if glob.config.debug:
                 log(f"{username}'s login failed - pw incorrect.", Ansi.LYELLOW)
             return await flash('error', 'Password is incorrect.', 'login')
 
         # login successful; cache password for next login
-        bcrypt_cache[pw_bcrypt] = pw_md5
+        await bcrypt_cache.set(pw_bcrypt, pw_md5)
 
     # user not verified; render verify
     if not user_info['priv'] & Privileges.Verified:
@@ -525,8 +608,8 @@ async def register_post():
     # TODO: add correct locking
     # (start of lock)
     pw_md5 = hashlib.md5(passwd_txt.encode()).hexdigest().encode()
-    pw_bcrypt = bcrypt.hashpw(pw_md5, bcrypt.gensalt())
-    glob.cache['bcrypt'][pw_bcrypt] = pw_md5  # cache pw
+    pw_bcrypt = await glob.hasher.hashpw(pw_md5)
+    await glob.cache['bcrypt'].set(pw_bcrypt, pw_md5)  # cache pw
 
     safe_name = utils.get_safe_name(username)
 
@@ -535,9 +618,14 @@ async def register_post():
             request.headers and
             (co := request.headers.get('CF-IPCountry', type=str)) is not None
     ):
-        country = co
+        country = co.lower()
     else:
-        country = 'xx'
+        # resolved locally where possible; nginx passes the
+        # client's ip as X-Real-IP, which only it may set.
+        ip = request.remote_addr
+        if ip in glob.config.trusted_proxies:
+            ip = request.headers.get('X-Real-IP', ip)
+        country = await utils.fetch_geoloc(ip)
 
     async with glob.db.pool.acquire() as conn:
         async with conn.cursor() as db_cursor:
@@ -557,6 +645,8 @@ async def register_post():
                 [(user_id, mode) for mode in range(8)]
             )
 
+    pin_to_primary()
+
     if glob.config.debug:
         log(f'{username} has registered - awaiting verification.', Ansi.LMAGENTA)
 
@@ -588,20 +678,31 @@ async def patreon_callback():
 
 @frontend.route('/docs')  # GET
 async def docs_no_data():
-    docs = []
-    async with asyncio.Lock():
-        for f in os.listdir('docs/'):
-            docs.append(os.path.splitext(f)[0])
-
-    return await render_template('docs.html', docs=docs)
+    return await render_template('docs.html', docs=glob.docs.names)
 
 
 @frontend.route('/doc/<doc>')  # GET
 async def docs(doc):
-    async with asyncio.Lock():
-        markdown = markdown2.markdown_path(f'docs/{doc.lower()}.md')
+    if (doc := glob.docs.get(doc)) is None:
+        return await render_template('404.html'), 404
 
-    return await render_template('doc.html', doc=markdown, doc_title=doc.lower().capitalize())
+    # the page also depends on who's logged in (the navbar),
+    # and the templates & assets (urls) it's rendered with.
+    user_id = session['user_data']['id'] if 'authenticated' in session else 0
+    etag = f'{doc.etag}-{glob.pages.version}-{user_id}'
+
+    if request.if_none_match.contains_weak(etag):
+        resp = await make_response('', 304)
+    else:
+        resp = await make_response(await render_template(
+            'doc.html', doc=doc.html, doc_title=doc.name.capitalize()))
+
+    # no Last-Modified; the page changes with more than the doc's
+    # mtime, so If-Modified-Since couldn't be answered safely.
+    resp.set_etag(etag, weak=True)
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    resp.headers['Vary'] = 'Cookie'
+    return resp
 
 
 @frontend.route('/github')
@@ -21,12 +21,184 @@ mysql = {
     'password': 'changeme',
 }
 
+# mysql connection pools; waiting over `acquire_timeout` seconds
+# for a connection fails the request with a 503. connections are
+# recycled after `recycle` seconds, and every pool is health
+# checked every `health_check_interval` seconds.
+mysql_pool_min_size = 1
+mysql_pool_max_size = 10
+mysql_acquire_timeout = 5.0
+mysql_pool_recycle = 60 * 60
+mysql_health_check_interval = 15
+
+# read replicas (each configured like `mysql`). /gw_api & admin
+# panel reads are spread over the healthy ones; players who've
+# just changed their account read from the primary for the next
+# `replica_pin_time` seconds, so a lagging replica isn't noticed.
+mysql_replicas = []
+replica_pin_time = 30
+
 patreon_client_id = ''
 patreon_secret = ''
 
 # path to gulag root (must have leading and following slash)
 path_to_gulag = '/path/to/gulag/'
 
+# how often (in seconds) the in-memory rank index is
+# re-synced with the stats table.
+rank_index_interval = 300
+
+# how often (in seconds) newly registered players
+# are added to the in-memory player search index.
+player_index_interval = 60
+
+# how often (in seconds) the whole player search index is re-read,
+# picking up renames (made in-game, or served by another worker).
+player_index_full_interval = 900
+
+# every ranked player's global & country ranks are recorded here
+# once a day (for profile graphs), for the last `days` days.
+rank_history_path = '.data/rank_history'
+rank_history_days = 365
+
+# where caches shared between workers (api responses, and bcrypt
+# credentials) are kept: 'memory' (per worker), 'shared' (shared
+# memory, for workers forked by `python3.9 main.py --workers N`),
+# or 'redis' (any redis protocol server; only point this at a
+# private instance, as anyone who can write to it can poison pages).
+cache_backend = 'memory'
+
+# 'shared': entries hash to one of `slots` slots of `slot_size`
+# bytes; larger entries aren't cached.
+cache_shared_slots = 8192
+cache_shared_slot_size = 16 * 1024
+
+# 'redis': connection details & connections per worker.
+redis = {
+    'host': 'localhost',
+    'port': 6379,
+    'db': 0,
+    'password': None,
+    'pool_size': 8
+}
+
+# api response cache; entries live for `ttl` seconds. with the
+# 'memory' backend, the least recently used are evicted past `size`.
+response_cache_ttl = 30
+response_cache_size = 1024
+
+# how long (in seconds) leaderboard player counts are cached.
+leaderboard_total_ttl = 300
+
+# render the leaderboard's first page server-side (rather than
+# from the browser with vue.js); the rendered tables are cached
+# per (mode, sort, mods, page) for `table_ttl` seconds. (a table is
+# ~30KB; where it won't fit in a 'shared' cache backend's slot, its
+# rows (~8KB) are cached instead, & it's rendered per request.)
+leaderboard_ssr = False
+leaderboard_table_ttl = 30
+
+# how long (in seconds) players' score counts are cached.
+score_count_ttl = 60
+
+# beatmap metadata cache; entries live for `ttl` seconds,
+# and the least recently used are evicted past `size`.
+beatmap_cache_size = 20000
+beatmap_cache_ttl = 60 * 60
+
+# how often (in seconds) we check for newly submitted scores;
+# caches derived from scores catch up on this interval.
+score_watermark_interval = 10
+
+# cache per-user grade counts, so repeat profile views
+# only ever count the scores submitted since.
+grade_cache = True
+grade_cache_size = 10000
+
+# per-user most played map counts are kept in memory, up to `max_maps`
+# (map, count)s in all (roughly 200 bytes each, per worker). they're
+# backfilled for the `backfill` most recently active players at startup,
+# and again on SIGUSR1 (`kill -USR1 <pid>`) or from the admin panel.
+most_played_max_maps = 250000
+most_played_backfill = 500
+
+# verified bcrypt credentials are cached to skip bcrypt on later
+# logins; entries expire after `ttl` seconds. if a path is set,
+# the cache persists there across restarts, and is shared by any
+# workers pointed at the same file (synced every `sync_interval`).
+bcrypt_cache_size = 8192
+bcrypt_cache_ttl = 60 * 60 * 24 * 7
+bcrypt_cache_path = None  # e.g. '.data/bcrypt_cache'
+bcrypt_cache_sync_interval = 60
+
+# bcrypt runs in a pool off the event loop ('thread' or 'process');
+# once `max_pending` hashes are in flight, requests get a 503.
+bcrypt_pool = 'thread'
+bcrypt_pool_workers = 4
+bcrypt_pool_max_pending = 64
+
+# sizes uploaded avatars & banners are stored at; the first is
+# saved as `{id}.{ext}`, any others as `{id}_{w}x{h}.{ext}`.
+avatar_sizes = ((256, 256), (128, 128), (64, 64))
+banner_sizes = ((1140, 215), (570, 108))
+
+# avatars & banners are served from /a/<id> & /b/<id>. the file each id
+# maps to is remembered (for up to `index_size` ids) for `index_ttl`
+# seconds, & checked with a stat on each use; files up to `cache_max_file` bytes are served from memory
+# (up to `cache_bytes` in all), and larger ones from disk - by nginx,
+# with sendfile, if `accel_prefix` is set (see ext/nginx.conf).
+image_index_size = 50000
+image_index_ttl = 60
+image_cache_bytes = 64 * 1024 * 1024
+image_cache_max_file = 256 * 1024
+image_max_age = 300
+image_accel_prefix = None  # e.g. '/_images'
+
+# how often (in seconds) docs/ is checked for changed markdown.
+docs_refresh_interval = 30
+
+# the admin dashboard's stats are recomputed in the background
+# every `interval` seconds; forced refreshes are ignored if the
+# stats are younger than `min_interval` seconds.
+dashboard_refresh_interval = 60
+dashboard_min_refresh_interval = 5
+
+# queries taking at least this long (in ms) are logged.
+slow_query_threshold = 100
+
+# ip geolocation (for new players' countries). ips are resolved from
+# a local database if one is given (build one from a `start,end,country`
+# csv with `python3.9 -m objects.geoloc ranges.csv geoloc.db`), and
+# from ip-api.com otherwise, giving up after `timeout` seconds.
+geoloc_db_path = None  # e.g. 'ext/geoloc.db'
+geoloc_cache_size = 10000
+geoloc_cache_ttl = 60 * 60 * 24
+geoloc_timeout = 1.0
+
+# addresses of reverse proxies (e.g. nginx, see ext/nginx.conf) whose
+# X-Real-IP header is trusted as the client's ip; from anyone else,
+# it's ignored (a client could set it to pick its own country).
+trusted_proxies = ('127.0.0.1', '::1')
+
+# templates are compiled at startup, and their bytecode cached
+# here across restarts (None to keep it in memory only).
+template_cache_path = '.data/templates'
+
+# pages which only vary by whether the visitor is logged in; these
+# are rendered once at startup and served as-is to anonymous visitors.
+static_pages = ('home.html', 'faq.html', '404.html')
+
+# requested by each worker as it starts (after building its
+# indexes), so it isn't cold when it starts taking traffic.
+warmup_paths = (
+    '/gw_api/get_leaderboard?mode=std&mods=vn&sort=pp',
+    '/gw_api/get_leaderboard?mode=std&mods=rx&sort=pp',
+    '/gw_api/get_leaderboard?mode=std&mods=ap&sort=pp',
+    '/gw_api/get_leaderboard?mode=taiko&mods=vn&sort=pp',
+    '/gw_api/get_leaderboard?mode=catch&mods=vn&sort=pp',
+    '/gw_api/get_leaderboard?mode=mania&mods=vn&sort=pp'
+)
+
 # enable debug (disable when in production to improve performance)
 debug = False
 
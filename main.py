@@ -3,19 +3,57 @@
 
 __all__ = ()
 
+import argparse
+import asyncio
+import hashlib
 import os
+import signal
+import time
+from typing import Coroutine
 
 import aiohttp
 import orjson
+from jinja2 import FileSystemBytecodeCache
+from jinja2 import TemplateError
 from quart import Quart
-from quart import render_template
+from quart import Response
+from quart import g
+from quart import request
 
 from cmyui.logging import Ansi
 from cmyui.logging import log
-from cmyui.mysql import AsyncSQLPool
 from cmyui.version import Version
 
 from objects import glob
+from objects import prefork
+from objects.assets import AssetManifest
+from objects.backends import create_backend
+from objects.beatmaps import BeatmapCache
+from objects.cache import ResponseCache
+from objects.credentials import CredentialCache
+from objects.database import PoolTimeout
+from objects.database import RoutedSQLPool
+from objects.dashboard import DashboardSnapshot
+from objects.docs import DocsIndex
+from objects.geoloc import GeoDatabase
+from objects.geoloc import GeoResolver
+from objects.grades import GradeCache
+from objects.hashing import HashPool
+from objects.hashing import PoolSaturated
+from objects.imagestore import ImageStore
+from objects.metrics import Metrics
+from objects.metrics import RequestStats
+from objects.metrics import current_request
+from objects.mostplayed import MostPlayed
+from objects.pages import StaticPages
+from objects.pages import render_page
+from objects.playersearch import PlayerIndex
+from objects.rankhistory import RankHistory
+from objects.rankings import RankIndex
+from objects.responses import StreamedResponse
+from objects.utils import csrf_token
+from objects.utils import flash
+from objects.watermarks import ScoreWatermarks
 
 app = Quart(__name__)
 
@@ -25,20 +63,311 @@ version = Version(1, 2, 0)
 # we recommend using a long randomly generated ascii string.
 app.secret_key = glob.config.secret_key
 
+# created at import, before any workers are forked (see
+# `objects.prefork`), so a shared memory backend is shared.
+glob.cache_backend = create_backend(glob.config.cache_backend)
+
+# the app's background tasks (refresh loops etc.); referenced here
+# so they can't be garbage collected mid-run, & any failure is logged.
+background_tasks: set[asyncio.Task] = set()
+
+
+def _background_task_done(task: asyncio.Task) -> None:
+    background_tasks.discard(task)
+    if not task.cancelled() and (exc := task.exception()) is not None:
+        log(f'Background task {task.get_coro().__qualname__} failed: {exc!r}',
+            Ansi.LRED)
+
+
+def run_in_background(coro: Coroutine) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(_background_task_done)
+    return task
+
 
 @app.before_serving
 async def mysql_conn() -> None:
-    glob.db = AsyncSQLPool()
-    await glob.db.connect(glob.config.mysql)
+    glob.metrics = Metrics()
+    glob.db = RoutedSQLPool(acquire_timeout=glob.config.mysql_acquire_timeout)
+    await glob.db.connect(
+        glob.config.mysql,
+        replicas=glob.config.mysql_replicas,
+        minsize=glob.config.mysql_pool_min_size,
+        maxsize=glob.config.mysql_pool_max_size,
+        recycle=glob.config.mysql_pool_recycle
+    )
+    run_in_background(glob.db.run(glob.config.mysql_health_check_interval))
     log('Connected to MySQL!', Ansi.LMAGENTA)
 
 
+@app.after_serving
+async def mysql_close() -> None:
+    await glob.db.close()
+
+
 @app.before_serving
 async def http_conn() -> None:
     glob.http = aiohttp.ClientSession(json_serialize=orjson.dumps)
     log('Got our Client Session!', Ansi.LMAGENTA)
 
 
+@app.before_serving
+async def geoloc_resolver() -> None:
+    if glob.config.geoloc_db_path is not None:
+        geoloc_db = GeoDatabase(glob.config.geoloc_db_path)
+        log(f'Loaded {geoloc_db.count} ip ranges.', Ansi.LMAGENTA)
+    else:
+        geoloc_db = None
+
+    glob.geoloc = GeoResolver(
+        db=geoloc_db,
+        max_size=glob.config.geoloc_cache_size,
+        ttl=glob.config.geoloc_cache_ttl,
+        timeout=glob.config.geoloc_timeout
+    )
+
+
+@app.before_serving
+async def response_cache() -> None:
+    glob.responses = ResponseCache(
+        backend=glob.cache_backend,
+        ttl=glob.config.response_cache_ttl
+    )
+
+
+@app.before_serving
+async def beatmap_cache() -> None:
+    glob.beatmaps = BeatmapCache(
+        max_size=glob.config.beatmap_cache_size,
+        ttl=glob.config.beatmap_cache_ttl
+    )
+
+
+@app.before_serving
+async def bcrypt_cache() -> None:
+    glob.cache['bcrypt'] = CredentialCache(
+        secret=glob.config.secret_key,
+        max_size=glob.config.bcrypt_cache_size,
+        ttl=glob.config.bcrypt_cache_ttl,
+        path=glob.config.bcrypt_cache_path,
+        # a per-worker backend would only duplicate our own entries.
+        backend=(glob.cache_backend
+                 if glob.config.cache_backend != 'memory' else None)
+    )
+
+    if glob.config.bcrypt_cache_path is not None:
+        await glob.cache['bcrypt'].sync()
+        run_in_background(
+            glob.cache['bcrypt'].run(glob.config.bcrypt_cache_sync_interval))
+
+
+@app.after_serving
+async def save_bcrypt_cache() -> None:
+    await glob.cache['bcrypt'].sync()
+
+
+@app.before_serving
+async def hash_pool() -> None:
+    glob.hasher = HashPool(
+        kind=glob.config.bcrypt_pool,
+        workers=glob.config.bcrypt_pool_workers,
+        max_pending=glob.config.bcrypt_pool_max_pending
+    )
+
+
+@app.after_serving
+async def shutdown_hash_pool() -> None:
+    glob.hasher.shutdown()
+
+
+@app.before_serving
+async def score_watermarks() -> None:
+    glob.watermarks = ScoreWatermarks()
+    await glob.watermarks.refresh()
+    run_in_background(
+        glob.watermarks.run(glob.config.score_watermark_interval))
+
+    glob.grades = GradeCache(max_size=glob.config.grade_cache_size)
+
+    glob.most_played = MostPlayed(max_maps=glob.config.most_played_max_maps)
+    await glob.most_played.rebuild(glob.config.most_played_backfill)
+
+    # rebuilt on SIGUSR1 (e.g. from the admin panel), in every worker.
+    asyncio.get_running_loop().add_signal_handler(
+        signal.SIGUSR1, lambda: run_in_background(
+            glob.most_played.rebuild(glob.config.most_played_backfill)))
+
+
+@app.before_serving
+async def docs_index() -> None:
+    glob.docs = DocsIndex('docs')
+    await glob.docs.refresh()
+    run_in_background(glob.docs.run(glob.config.docs_refresh_interval))
+
+
+@app.before_serving
+async def dashboard_snapshot() -> None:
+    glob.dashboard = DashboardSnapshot(
+        min_interval=glob.config.dashboard_min_refresh_interval)
+    await glob.dashboard.refresh()
+    run_in_background(
+        glob.dashboard.run(glob.config.dashboard_refresh_interval))
+
+
+@app.before_serving
+async def rank_index() -> None:
+    glob.ranks = RankIndex()
+    await glob.ranks.refresh()
+    run_in_background(glob.ranks.run(glob.config.rank_index_interval))
+    log('Built the rank index!', Ansi.LMAGENTA)
+
+
+@app.before_serving
+async def player_index() -> None:
+    glob.players = PlayerIndex()
+    await glob.players.refresh()
+    run_in_background(glob.players.run(glob.config.player_index_interval,
+                                       glob.config.player_index_full_interval))
+    log(f'Indexed {len(glob.players.users)} players for search!', Ansi.LMAGENTA)
+
+
+@app.before_serving
+async def rank_history() -> None:
+    # snapshots are taken from the rank index, so it must be built.
+    glob.rank_history = RankHistory(glob.config.rank_history_path,
+                                    glob.config.rank_history_days)
+    await glob.rank_history.snapshot()
+    run_in_background(glob.rank_history.run())
+
+
+@app.before_serving
+async def image_stores() -> None:
+    # avatars & banners, as uploaded on the settings pages.
+    stores = {}
+    for kind in ('avatars', 'banners'):
+        accel_prefix = glob.config.image_accel_prefix
+        stores[kind] = ImageStore(
+            directory=f'{glob.config.path_to_gulag}.data/{kind}',
+            fallback='static/images/avatar_notwork.png',
+            index_size=glob.config.image_index_size,
+            index_ttl=glob.config.image_index_ttl,
+            max_bytes=glob.config.image_cache_bytes,
+            max_file=glob.config.image_cache_max_file,
+            max_age=glob.config.image_max_age,
+            accel_prefix=accel_prefix and f'{accel_prefix}/{kind}'
+        )
+
+    glob.avatars = stores['avatars']
+    glob.banners = stores['banners']
+
+
+@app.before_serving
+async def metrics_gauges() -> None:
+    # sampled whenever /metrics is scraped.
+    glob.metrics.gauges['response_cache'] = lambda: glob.responses.stats
+    glob.metrics.gauges['bcrypt_cache'] = lambda: glob.cache['bcrypt'].stats
+    glob.metrics.gauges['bcrypt_pool'] = lambda: glob.hasher.stats
+    glob.metrics.gauges['beatmap_cache'] = lambda: glob.beatmaps.stats
+    glob.metrics.gauges['cache_backend'] = lambda: glob.cache_backend.stats
+    glob.metrics.gauges['avatar_store'] = lambda: glob.avatars.stats
+    glob.metrics.gauges['banner_store'] = lambda: glob.banners.stats
+
+    for pool in glob.db.pools:
+        glob.metrics.gauges[f'db_pool_{pool.name}'] = lambda pool=pool: pool.stats
+
+
+@app.before_serving
+async def static_assets() -> None:
+    # built by `python3.9 -m objects.assets`.
+    glob.assets = AssetManifest('static')
+    glob.assets.load()
+
+
+@app.before_serving
+async def compile_templates() -> None:
+    # compile every template now rather than on its first
+    # request; compiled bytecode is kept across restarts.
+    if glob.config.template_cache_path is not None:
+        os.makedirs(glob.config.template_cache_path, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(
+            glob.config.template_cache_path)
+
+    start = time.perf_counter()
+    names = app.jinja_env.list_templates()
+
+    # a deploy changing any template or asset changes this.
+    digest = hashlib.blake2b(glob.assets.version.encode(), digest_size=8)
+
+    for name in names:
+        try:
+            app.jinja_env.get_template(name)
+        except TemplateError as exc:
+            log(f'Failed to compile {name}: {exc}', Ansi.LRED)
+
+        source, _, _ = app.jinja_env.loader.get_source(app.jinja_env, name)
+        digest.update(source.encode())
+
+    glob.pages = StaticPages(digest.hexdigest())
+    await glob.pages.render(app, glob.config.static_pages)
+
+    elapsed = (time.perf_counter() - start) * 1000
+    log(f'Compiled {len(names)} templates in {elapsed:.2f}ms.', Ansi.LMAGENTA)
+
+
+@app.before_serving
+async def warmup() -> None:
+    # runs last, so a new worker has its indexes built & its caches
+    # filled (or finds them already filled by the others) before it
+    # takes traffic.
+    start = time.perf_counter()
+    client = app.test_client()
+
+    for path in glob.config.warmup_paths:
+        resp = await client.get(path)
+        if resp.status_code != 200:
+            log(f'Warmup request for {path} failed ({resp.status_code}).', Ansi.LRED)
+
+    elapsed = (time.perf_counter() - start) * 1000
+    log(f'Warmed up {len(glob.config.warmup_paths)} routes in {elapsed:.2f}ms.', Ansi.LMAGENTA)
+
+
+@app.before_request
+async def start_request_timer() -> None:
+    g.start_time = time.perf_counter()
+    current_request.set(RequestStats())
+
+
+@app.after_request
+async def record_request_metrics(response: Response) -> Response:
+    start_time = g.start_time
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    method = request.method
+    stats = current_request.get()
+
+    def observe() -> None:
+        glob.metrics.observe_request(method, endpoint, response.status_code,
+                                     time.perf_counter() - start_time, stats)
+
+    if isinstance(response, StreamedResponse):
+        # its body (& queries) are still to come.
+        response.call_on_close(observe)
+    else:
+        observe()
+
+    return response
+
+
+@app.route('/assets/<path:path>')
+async def assets(path: str) -> Response:
+    return await glob.assets.serve(path)
+
+
+@app.route('/metrics')
+async def metrics() -> Response:
+    return Response(glob.metrics.expose(), mimetype='text/plain; version=0.0.4')
+
+
 # globals which can be used in template code
 _version = repr(version)
 
@@ -76,6 +405,24 @@ def domain() -> str:
     return _domain
 
 
+app.add_template_global(csrf_token)
+
+
+@app.template_global()
+def asset(path: str) -> str:
+    return glob.assets.url(path)
+
+
+@app.template_global()
+def flag(country: str, cls: str = '') -> str:
+    return glob.assets.flag(country, cls)
+
+
+@app.template_global()
+def flag_styles() -> str:
+    return glob.assets.flag_styles()
+
+
 from blueprints.frontend import frontend
 
 app.register_blueprint(frontend)
@@ -92,9 +439,31 @@ app.register_blueprint(api, url_prefix='/gw_api')
 @app.errorhandler(404)
 async def page_not_found(e):
     # NOTE: we set the 404 status explicitly
-    return await render_template('404.html'), 404
+    return await render_page('404.html', status=404)
+
+
+@app.errorhandler(PoolSaturated)
+async def hash_pool_saturated(e):
+    # too many logins are waiting on bcrypt; shed load.
+    return await flash('error', 'The server is busy, please try again shortly.', 'home'), 503
+
+
+@app.errorhandler(PoolTimeout)
+async def db_pool_timeout(e):
+    # every database connection is tied up; shed load.
+    return await flash('error', 'The server is busy, please try again shortly.', 'home'), 503
 
 
 os.chdir(os.path.dirname(os.path.realpath(__file__)))
 if __name__ == "__main__":
-    app.run(debug=glob.config.debug)  # blocking call
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=0,
+                        help='serve from this many forked workers (with hypercorn)')
+    parser.add_argument('--bind', default='127.0.0.1:8000',
+                        help='address to serve workers on')
+    args = parser.parse_args()
+
+    if args.workers:
+        prefork.serve(app, args.bind, args.workers)  # blocking call
+    else:
+        app.run(debug=glob.config.debug)  # blocking call
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('AssetManifest', 'build')
+
+import gzip
+import hashlib
+import io
+import mimetypes
+import os
+import re
+import sys
+
+import brotli
+import orjson
+import rcssmin
+import rjsmin
+from cmyui.logging import Ansi
+from cmyui.logging import log
+from markupsafe import Markup
+from PIL import Image
+from quart import Response
+from quart import abort
+from quart import request
+from quart import send_file
+
+from objects.utils import atomic_write
+
+# built assets are written (fingerprinted) to `static/dist`,
+# alongside a manifest of {source path: built path}.
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+FLAGS_DIR = 'images/flags'
+
+# worth serving compressed; most images are compressed already.
+COMPRESSIBLE = frozenset({'.js', '.css', '.svg', '.json', '.webmanifest',
+                          '.xml', '.ttf', '.ico', '.txt'})
+
+# fingerprinted names never change content, so may be cached forever.
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+CSS_URL = re.compile(r'''url\((['"]?)/static/([^'")]+)\1\)''')
+
+
+class AssetManifest:
+    """The assets written by `build`, and how to serve them.
+
+    Templates get their urls from `url()`, which falls back to the
+    unbuilt file under /static if there's no build (e.g. in dev)."""
+
+    def __init__(self, static_dir: str) -> None:
+        self.directory = os.path.join(static_dir, DIST_DIR)
+
+        # {source path: built path}
+        self.files: dict[str, str] = {}
+        # {built path: precompressed encodings available}
+        self.encodings: dict[str, list[str]] = {}
+        self.flags: frozenset[str] = frozenset()
+        # changes with every build which changes any asset.
+        self.version = ''
+
+    def load(self) -> None:
+        try:
+            with open(os.path.join(self.directory, MANIFEST), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            log('No built assets; serving them from /static as-is.', Ansi.LYELLOW)
+            return
+
+        manifest = orjson.loads(data)
+        self.version = hashlib.sha256(data).hexdigest()[:12]
+
+        self.files = manifest['files']
+        self.encodings = manifest['encodings']
+        self.flags = frozenset(manifest['flags'])
+        log(f'Loaded {len(self.files)} built assets.', Ansi.LMAGENTA)
+
+    def url(self, path: str) -> str:
+        if (built := self.files.get(path)) is not None:
+            return f'/assets/{built}'
+        return f'/static/{path}'
+
+    def flag(self, country: str, cls: str = '') -> Markup:
+        """A country's flag; from the sprite (if built), else its own image.
+        `cls` should size it (by either width or height)."""
+        country = country.lower()
+
+        if country in self.flags:
+            return Markup('<span class="flag flag-{} {}" title="{}"></span>').format(
+                country, cls, country.upper())
+
+        return Markup('<img src="/static/{}/{}.png" class="{}">').format(
+            FLAGS_DIR, country.upper(), cls)
+
+    def flag_styles(self) -> Markup:
+        """The flag sprite's stylesheet, if it's been built."""
+        if 'css/flags.css' not in self.files:
+            return Markup('')
+
+        return Markup('<link rel="stylesheet" href="{}" />').format(
+            self.url('css/flags.css'))
+
+    async def serve(self, path: str) -> Response:
+        if path not in self.encodings:
+            abort(404)  # only what we've built (so no traversal, either)
+
+        file_path = os.path.join(self.directory, path)
+        encoding = None
+
+        for candidate in ('br', 'gzip'):
+            if (
+                candidate in self.encodings[path] and
+                request.accept_encodings[candidate]
+            ):
+                encoding = candidate
+                file_path += '.br' if candidate == 'br' else '.gz'
+                break
+
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        resp = await send_file(file_path, mimetype=mimetype)
+
+        if encoding is not None:
+            resp.headers['Content-Encoding'] = encoding
+        resp.headers['Cache-Control'] = IMMUTABLE
+        resp.vary.add('Accept-Encoding')
+        return resp
+
+
+""" building """
+
+
+def _fingerprint(path: str, data: bytes) -> str:
+    root, ext = os.path.splitext(path)
+    return f'{root}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+
+
+def _write(path: str, data: bytes) -> None:
+    # swapped in place, so workers never serve a partial file;
+    # & readable (0644) by a fronting nginx, too.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    atomic_write(path, data)
+
+
+def _emit(dist_dir: str, path: str, data: bytes,
+          manifest: dict[str, dict]) -> None:
+    built = _fingerprint(path, data)
+    _write(os.path.join(dist_dir, built), data)
+
+    encodings = []
+    if os.path.splitext(path)[1] in COMPRESSIBLE:
+        for encoding, ext, compressed in (
+            ('br', '.br', brotli.compress(data, quality=11)),
+            ('gzip', '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+        ):
+            if len(compressed) < len(data):
+                _write(os.path.join(dist_dir, built + ext), compressed)
+                encodings.append(encoding)
+
+    manifest['files'][path] = built
+    manifest['encodings'][built] = encodings
+
+
+def _sprite_flags(static_dir: str, dist_dir: str,
+                  manifest: dict[str, dict]) -> None:
+    flags_dir = os.path.join(static_dir, FLAGS_DIR)
+    names = sorted(n for n in os.listdir(flags_dir) if n.endswith('.png'))
+    if not names:
+        return
+
+    images = [Image.open(os.path.join(flags_dir, n)).convert('RGBA') for n in names]
+    width, height = images[0].size  # all flags share a size
+
+    cols = min(16, len(images))
+    rows = -(-len(images) // cols)
+    sprite = Image.new('RGBA', (cols * width, rows * height))
+
+    css = [
+        # sized by the page (width or height), scaling the sprite to fit.
+        f'.flag{{display:inline-block;vertical-align:middle;'
+        f'aspect-ratio:{width}/{height};'
+        f'background-size:{cols * 100}% {rows * 100}%}}'
+    ]
+
+    for idx, (name, image) in enumerate(zip(names, images)):
+        row, col = divmod(idx, cols)
+        sprite.paste(image.resize((width, height)), (col * width, row * height))
+
+        x = col / (cols - 1) * 100 if cols > 1 else 0
+        y = row / (rows - 1) * 100 if rows > 1 else 0
+        css.append(f'.flag-{name[:-4].lower()}'
+                   f'{{background-position:{x:.4f}% {y:.4f}%}}')
+
+    buf = io.BytesIO()
+    sprite.save(buf, 'PNG', optimize=True)
+    _emit(dist_dir, 'images/flags.png', buf.getvalue(), manifest)
+
+    css.insert(1, f'.flag{{background-image:url('
+                  f'/assets/{manifest["files"]["images/flags.png"]})}}')
+    _emit(dist_dir, 'css/flags.css', '\n'.join(css).encode(), manifest)
+
+    manifest['flags'] = [name[:-4].lower() for name in names]
+
+
+def build(static_dir: str) -> dict[str, dict]:
+    """Minify, fingerprint & precompress everything under `static_dir`
+    (spriting the flags), writing it all to `static_dir/dist`."""
+    dist_dir = os.path.join(static_dir, DIST_DIR)
+    manifest = {'files': {}, 'encodings': {}, 'flags': []}
+
+    sources = []
+    for root, dirs, files in os.walk(static_dir):
+        rel_root = os.path.relpath(root, static_dir)
+        if rel_root == DIST_DIR:
+            dirs.clear()
+            continue
+
+        for name in files:
+            path = os.path.normpath(os.path.join(rel_root, name))
+            if os.path.dirname(path) != FLAGS_DIR:
+                sources.append(path.replace(os.sep, '/'))
+
+    _sprite_flags(static_dir, dist_dir, manifest)
+
+    # css last, so its urls can point at the other built files.
+    sources.sort(key=lambda p: (p.endswith('.css'), p))
+
+    for path in sources:
+        with open(os.path.join(static_dir, path), 'rb') as f:
+            data = f.read()
+
+        if path.endswith('.js') and not path.endswith('.min.js'):
+            data = rjsmin.jsmin(data.decode()).encode()
+        elif path.endswith('.css'):
+            data = CSS_URL.sub(
+                lambda m: (f'url(/assets/{manifest["files"][m[2]]})'
+                           if m[2] in manifest['files'] else m[0]),
+                rcssmin.cssmin(data.decode())
+            ).encode()
+
+        _emit(dist_dir, path, data, manifest)
+
+    _write(os.path.join(dist_dir, MANIFEST), orjson.dumps(manifest))
+    return manifest
+
+
+if __name__ == '__main__':
+    # usage: python3.9 -m objects.assets [static dir]
+    static_dir = sys.argv[1] if len(sys.argv) > 1 else 'static'
+    manifest = build(static_dir)
+    print(f'Built {len(manifest["files"])} assets '
+          f'({len(manifest["flags"])} flags sprited).')
@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('CacheBackend', 'MemoryBackend', 'SharedMemoryBackend',
+           'RedisBackend', 'RedisError', 'create_backend')
+
+import abc
+import asyncio
+import contextlib
+import fcntl
+import hashlib
+import mmap
+import struct
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Iterator
+from typing import Optional
+from typing import Union
+
+from cmyui.logging import Ansi
+from cmyui.logging import log
+
+from objects import glob
+
+
+class CacheBackend(abc.ABC):
+    """Where caches which should be shared between workers keep
+    their entries; keys are strings, and values are bytes."""
+
+    @abc.abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abc.abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def clear(self, prefix: str) -> None:
+        """Drop every key starting with `prefix`."""
+
+    def fits(self, key: str, size: int) -> bool:
+        """Whether a value of `size` bytes would be stored for `key`."""
+        return True
+
+    @property
+    def stats(self) -> dict[str, float]:
+        return {}
+
+
+class MemoryBackend(CacheBackend):
+    """A size-bounded, per-process LRU with per-entry expiry.
+
+    Nothing is shared between workers; this is the default for a
+    single worker, and the stand-in for the others in development."""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        # {key: (expires_at, value)}
+        self.entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        if (entry := self.entries.get(key)) is None:
+            return None
+
+        if entry[0] < time.monotonic():
+            del self.entries[key]
+            return None
+
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    async def delete(self, key: str) -> None:
+        self.entries.pop(key, None)
+
+    async def clear(self, prefix: str) -> None:
+        for key in [k for k in self.entries if k.startswith(prefix)]:
+            del self.entries[key]
+
+    @property
+    def stats(self) -> dict[str, float]:
+        return {'size': len(self.entries)}
+
+
+# slot layout: key hash, expires at (unix), key length, value length.
+SLOT_HEADER = struct.Struct('<QdHI')
+
+
+class SharedMemoryBackend(CacheBackend):
+    """A direct-mapped cache in an anonymous shared memory mapping.
+
+    It must be created before workers are forked (see `objects.prefork`)
+    for them to share it. Each key hashes to one fixed size slot, which
+    a colliding key simply overwrites; values too large for a slot
+    aren't cached.
+
+    Each slot is guarded by a (posix record) lock on its byte of an
+    unlinked file; they're only held for a copy, & the kernel drops
+    any held by a worker which dies, so a crash can't wedge a slot."""
+
+    def __init__(self, slots: int, slot_size: int) -> None:
+        self.slots = slots
+        self.slot_size = slot_size
+        self.mmap = mmap.mmap(-1, slots * slot_size)  # MAP_SHARED
+        self.lock_file = tempfile.TemporaryFile()
+
+        self.oversized = 0
+
+    @contextlib.contextmanager
+    def _locked(self, idx: int, count: int = 1) -> Iterator[None]:
+        # (locks are per process; a worker's event loop never
+        # yields while holding one, so that's all we need.)
+        fcntl.lockf(self.lock_file, fcntl.LOCK_EX, count, idx)
+        try:
+            yield
+        finally:
+            fcntl.lockf(self.lock_file, fcntl.LOCK_UN, count, idx)
+
+    def _slot(self, key: bytes) -> tuple[int, int]:
+        key_hash = int.from_bytes(
+            hashlib.blake2b(key, digest_size=8).digest(), 'little')
+        return key_hash, key_hash % self.slots
+
+    def _matches(self, offset: int, key_hash: int,
+                 key: bytes) -> Optional[tuple[float, int]]:
+        slot_hash, expires_at, key_len, value_len = \
+            SLOT_HEADER.unpack_from(self.mmap, offset)
+
+        start = offset + SLOT_HEADER.size
+        if slot_hash != key_hash or self.mmap[start:start + key_len] != key:
+            return None
+
+        return expires_at, value_len
+
+    async def get(self, key: str) -> Optional[bytes]:
+        key = key.encode()
+        key_hash, idx = self._slot(key)
+        offset = idx * self.slot_size
+
+        with self._locked(idx):
+            if (entry := self._matches(offset, key_hash, key)) is None:
+                return None
+
+            expires_at, value_len = entry
+            if expires_at < time.time():
+                return None
+
+            start = offset + SLOT_HEADER.size + len(key)
+            return self.mmap[start:start + value_len]
+
+    def fits(self, key: str, size: int) -> bool:
+        return SLOT_HEADER.size + len(key.encode()) + size <= self.slot_size
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        if not self.fits(key, len(value)):
+            self.oversized += 1
+            return
+
+        key = key.encode()
+        key_hash, idx = self._slot(key)
+        offset = idx * self.slot_size
+        start = offset + SLOT_HEADER.size
+
+        with self._locked(idx):
+            SLOT_HEADER.pack_into(self.mmap, offset, key_hash,
+                                  time.time() + ttl, len(key), len(value))
+            self.mmap[start:start + len(key)] = key
+            self.mmap[start + len(key):start + len(key) + len(value)] = value
+
+    async def delete(self, key: str) -> None:
+        key = key.encode()
+        key_hash, idx = self._slot(key)
+        offset = idx * self.slot_size
+
+        with self._locked(idx):
+            if self._matches(offset, key_hash, key) is not None:
+                SLOT_HEADER.pack_into(self.mmap, offset, 0, 0.0, 0, 0)
+
+    async def clear(self, prefix: str) -> None:
+        prefix = prefix.encode()
+        start = SLOT_HEADER.size
+
+        with self._locked(0, self.slots):
+            for idx in range(self.slots):
+                offset = idx * self.slot_size
+                key_len = SLOT_HEADER.unpack_from(self.mmap, offset)[2]
+                key = self.mmap[offset + start:offset + start + key_len]
+                if key_len and key.startswith(prefix):
+                    SLOT_HEADER.pack_into(self.mmap, offset, 0, 0.0, 0, 0)
+
+    @property
+    def stats(self) -> dict[str, float]:
+        return {'oversized': self.oversized}
+
+
+class RedisError(Exception):
+    """An error reply from a redis server."""
+
+
+RedisReply = Union[None, int, bytes, list]
+
+
+class RedisBackend(CacheBackend):
+    """A cache on a redis protocol server (redis, keydb, dragonfly..),
+    over a small pool of connections opened as they're needed.
+
+    Errors talking to the server are logged & counted, and treated
+    as cache misses; a cache outage shouldn't take the site down."""
+
+    def __init__(self, host: str, port: int, db: int = 0,
+                 password: Optional[str] = None, pool_size: int = 8,
+                 prefix: str = 'gulag-web:') -> None:
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.pool_size = pool_size
+        self.prefix = prefix
+
+        # created on first use, within the worker's event loop.
+        self.slots: Optional[asyncio.Semaphore] = None
+        self.idle: list[tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+
+        self.errors = 0
+
+    @staticmethod
+    def _encode(*args: Union[str, bytes, int]) -> bytes:
+        buf = bytearray(b'*%d\r\n' % len(args))
+        for arg in args:
+            if isinstance(arg, str):
+                arg = arg.encode()
+            elif isinstance(arg, int):
+                arg = str(arg).encode()
+            buf += b'$%d\r\n%b\r\n' % (len(arg), arg)
+        return bytes(buf)
+
+    @classmethod
+    async def _read_reply(cls, reader: asyncio.StreamReader) -> RedisReply:
+        line = await reader.readuntil(b'\r\n')
+        kind, data = line[:1], line[1:-2]
+
+        if kind == b'+':
+            return data
+        if kind == b'-':
+            raise RedisError(data.decode())
+        if kind == b':':
+            return int(data)
+        if kind == b'$':
+            if (length := int(data)) == -1:
+                return None
+            return (await reader.readexactly(length + 2))[:-2]
+        if kind == b'*':
+            if (length := int(data)) == -1:
+                return None
+            return [await cls._read_reply(reader) for _ in range(length)]
+
+        raise RedisError(f'Unexpected reply: {line!r}')
+
+    async def _connect(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+
+        setup = []
+        if self.password is not None:
+            setup.append(('AUTH', self.password))
+        if self.db:
+            setup.append(('SELECT', self.db))
+
+        try:
+            for args in setup:
+                writer.write(self._encode(*args))
+                await self._read_reply(reader)
+        except BaseException:
+            writer.close()
+            raise
+
+        return reader, writer
+
+    async def command(self, *args: Union[str, bytes, int]) -> RedisReply:
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.pool_size)
+
+        async with self.slots:
+            conn = self.idle.pop() if self.idle else await self._connect()
+            reader, writer = conn
+
+            try:
+                writer.write(self._encode(*args))
+                reply = await self._read_reply(reader)
+            except RedisError:
+                self.idle.append(conn)  # the connection is still fine
+                raise
+            except BaseException:
+                writer.close()
+                raise
+
+            self.idle.append(conn)
+            return reply
+
+    async def _safe_command(self, *args: Union[str, bytes, int]) -> RedisReply:
+        try:
+            return await self.command(*args)
+        except (OSError, EOFError, asyncio.IncompleteReadError, RedisError) as exc:
+            self.errors += 1
+            if glob.config.debug:
+                log(f'Redis {args[0]} failed: {exc!r}.', Ansi.LRED)
+            return None
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._safe_command('GET', self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self._safe_command('SET', self.prefix + key, value,
+                                 'PX', int(ttl * 1000))
+
+    async def delete(self, key: str) -> None:
+        await self._safe_command('DEL', self.prefix + key)
+
+    async def clear(self, prefix: str) -> None:
+        cursor = b'0'
+        while True:
+            if (reply := await self._safe_command(
+                'SCAN', cursor, 'MATCH', f'{self.prefix}{prefix}*',
+                'COUNT', 1000
+            )) is None:
+                return
+
+            cursor, keys = reply
+            if keys:
+                await self._safe_command('DEL', *keys)
+            if cursor == b'0':
+                return
+
+    @property
+    def stats(self) -> dict[str, float]:
+        return {
+            'connections': len(self.idle),
+            'errors': self.errors
+        }
+
+
+def create_backend(kind: str) -> CacheBackend:
+    """Create the cache backend named `kind` from the config."""
+    if kind == 'memory':
+        return MemoryBackend(max_size=glob.config.response_cache_size)
+    elif kind == 'shared':
+        return SharedMemoryBackend(slots=glob.config.cache_shared_slots,
+                                   slot_size=glob.config.cache_shared_slot_size)
+    elif kind == 'redis':
+        return RedisBackend(**glob.config.redis)
+    else:
+        raise ValueError(f'Unknown cache backend: {kind!r}')
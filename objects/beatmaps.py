@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('MAP_COLUMNS', 'BeatmapCache')
+
+import time
+from collections import OrderedDict
+from typing import Any
+from typing import Iterable
+
+from cmyui.logging import Ansi
+from cmyui.logging import log
+
+from objects import glob
+
+MAP_COLUMNS = ('id', 'set_id', 'status', 'md5', 'artist', 'title',
+               'version', 'creator', 'total_length', 'max_combo',
+               'mode', 'bpm', 'cs', 'od', 'ar', 'hp', 'diff')
+
+
+class BeatmapCache:
+    """A shared LRU cache of beatmap metadata, keyed by md5.
+
+    Entries expire after `ttl` seconds, so changes to a map
+    (e.g. its ranked status) are eventually picked up."""
+
+    __slots__ = ('entries', 'max_size', 'ttl', 'hits', 'misses')
+
+    def __init__(self, max_size: int, ttl: int) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        # {md5: (expires_at, map)}
+        self.entries: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    async def get_many(self, md5s: Iterable[str]) -> dict[str, dict[str, Any]]:
+        """Return the metadata of each of `md5s` which exist,
+        fetching any we haven't cached in a single query."""
+        maps = {}
+        missing = []
+        now = time.monotonic()
+
+        for md5 in set(md5s):
+            entry = self.entries.get(md5)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(md5)
+                maps[md5] = entry[1]
+            else:
+                missing.append(md5)
+
+        self.hits += len(maps)
+        self.misses += len(missing)
+
+        if missing:
+            q = (f'SELECT {", ".join(MAP_COLUMNS)} FROM maps '
+                 f'WHERE md5 IN ({", ".join(["%s"] * len(missing))})')
+
+            if glob.config.debug:
+                log(q, Ansi.LMAGENTA)
+
+            for row in await glob.db.fetchall(q, missing):
+                maps[row['md5']] = row
+                self.entries[row['md5']] = (now + self.ttl, row)
+                self.entries.move_to_end(row['md5'])
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+        return maps
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses
+        }
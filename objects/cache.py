@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('ResponseCache', 'cached', 'http_cache')
+
+import asyncio
+import functools
+import hashlib
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Hashable
+from typing import Optional
+
+import orjson
+from quart import Response
+from quart import make_response
+from quart import request
+
+from objects import glob
+from objects.backends import CacheBackend
+from objects.responses import dumps
+
+# values are stored as json, or raw (behind this tag) if they're
+# bytes; never pickled, as a shared cache (e.g. redis) mustn't be
+# able to run code in the workers reading from it.
+RAW_TAG = b'\x00'
+
+
+class ResponseCache:
+    """A cache with per-entry expiry, kept in a `CacheBackend` so
+    that it can be shared by every worker. Values are bytes, or
+    anything json serializable (so tuples come back as lists).
+
+    Concurrent misses on the same key are coalesced, so only
+    one caller (per worker) runs the (expensive) producer while
+    the rest await its result rather than stampeding the database."""
+
+    def __init__(self, backend: CacheBackend, ttl: int,
+                 prefix: str = 'responses') -> None:
+        self.backend = backend
+        self.ttl = ttl
+        self.prefix = prefix
+
+        self.inflight: dict[Hashable, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _key(self, key: Hashable) -> str:
+        return f'{self.prefix}:{key!r}'
+
+    @staticmethod
+    def _encode(value: Any) -> bytes:
+        if isinstance(value, bytes):
+            return RAW_TAG + value
+        return dumps(value)
+
+    async def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for `key`, if it's still fresh."""
+        if (data := await self.backend.get(self._key(key))) is None:
+            return None
+
+        if data[:1] == RAW_TAG:
+            return data[1:]
+        return orjson.loads(data)
+
+    async def set(self, key: Hashable, value: Any,
+                  ttl: Optional[int] = None) -> None:
+        """Store `value` for `key`, for `ttl` (or our default) seconds."""
+        await self.backend.set(self._key(key), self._encode(value),
+                               ttl or self.ttl)
+
+    def fits(self, key: Hashable, value: Any) -> bool:
+        """Whether the backend would store `value` for `key`
+        (e.g. not if it's larger than a shared memory slot)."""
+        return self.backend.fits(self._key(key), len(self._encode(value)))
+
+    async def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """Drop `key`, or every entry if no key is given."""
+        if key is None:
+            await self.backend.clear(f'{self.prefix}:')
+        else:
+            await self.backend.delete(self._key(key))
+
+    async def get_or_set(self, key: Hashable,
+                         producer: Callable[[], Awaitable[Any]],
+                         ttl: Optional[int] = None,
+                         cacheable: Callable[[Any], bool] = bool) -> Any:
+        """Return the cached value for `key`, or produce
+        (and cache) it; concurrent misses share one producer.
+
+        Produced values are only stored if `cacheable(value)`."""
+        while True:
+            if key not in self.inflight:
+                if (value := await self.get(key)) is not None:
+                    self.hits += 1
+                    return value
+
+            # (another caller may have missed while we were looking)
+            if (fut := self.inflight.get(key)) is None:
+                break
+
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(fut)
+            except asyncio.CancelledError:
+                if not fut.cancelled():
+                    raise  # we were cancelled ourselves
+                # the producing caller was cancelled; try again.
+
+        self.misses += 1
+        fut = asyncio.get_running_loop().create_future()
+        self.inflight[key] = fut
+
+        try:
+            value = await producer()
+        except Exception as exc:
+            fut.set_exception(exc)
+            fut.exception()  # mark as retrieved
+            raise
+        else:
+            fut.set_result(value)
+            if cacheable(value):
+                await self.set(key, value, ttl)
+            return value
+        finally:
+            # (e.g. cancelled) don't leave any waiters hanging.
+            if not fut.done():
+                fut.cancel()
+            del self.inflight[key]
+
+    @property
+    def stats(self) -> dict[str, float]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            **self.backend.stats
+        }
+
+
+def cached(*params: str, ttl: Optional[int] = None) -> Callable:
+    """Cache a route's successful responses in `glob.responses`,
+    keyed on the request path and the given query parameters."""
+    def wrapper(f: Callable) -> Callable:
+        @functools.wraps(f)
+        async def handler(*args, **kwargs):
+            key = (request.path,) + tuple(
+                request.args.get(p) for p in params)
+
+            # stored as one value; a `{status} {mimetype}` line, then the body.
+            async def produce() -> bytes:
+                resp = await make_response(await f(*args, **kwargs))
+                head = f'{resp.status_code} {resp.mimetype}\n'.encode()
+                return head + await resp.get_data()
+
+            # only successful responses are kept, though
+            # failures are still shared with any waiters.
+            entry = await glob.responses.get_or_set(
+                key, produce, ttl, cacheable=lambda entry: entry[:4] == b'200 ')
+
+            head, body = entry.split(b'\n', 1)
+            status, mimetype = head.decode().split(' ', 1)
+            return Response(body, status=int(status), mimetype=mimetype)
+        return handler
+    return wrapper
+
+
+def http_cache(max_age: int, stale_while_revalidate: int = 0,
+               version: Optional[Callable[[], Hashable]] = None) -> Callable:
+    """Set caching headers (`Cache-Control` & `ETag`) on a route's
+    successful json responses, and answer `If-None-Match` with a 304.
+
+    By default, a strong ETag is computed from the response body. If
+    `version` is given, a weak ETag is derived from the request and
+    the data version it returns (e.g. a score watermark) instead, so
+    that a revalidation is answered without running the route, and
+    streamed responses (whose body we never hold) get one too."""
+    cache_control = f'public, max-age={max_age}'
+    if stale_while_revalidate:
+        cache_control += f', stale-while-revalidate={stale_while_revalidate}'
+
+    def not_modified(etag: str, weak: bool) -> Response:
+        resp = Response(b'', status=304)
+        resp.set_etag(etag, weak=weak)
+        resp.headers['Cache-Control'] = cache_control
+        return resp
+
+    def wrapper(f: Callable) -> Callable:
+        @functools.wraps(f)
+        async def handler(*args, **kwargs):
+            if version is not None:
+                etag = hashlib.blake2b(
+                    repr((request.full_path, version())).encode(),
+                    digest_size=16).hexdigest()
+
+                if request.if_none_match.contains_weak(etag):
+                    return not_modified(etag, weak=True)
+
+            resp = await make_response(await f(*args, **kwargs))
+            if resp.status_code != 200:
+                return resp
+
+            # the api's validation errors are plain text 200s;
+            # only its json is a result worth caching.
+            if resp.mimetype != 'application/json':
+                resp.headers.setdefault('Cache-Control', 'no-store')
+                return resp
+
+            if version is None:
+                etag = hashlib.blake2b(await resp.get_data(),
+                                       digest_size=16).hexdigest()
+
+                if request.if_none_match.contains_weak(etag):
+                    return not_modified(etag, weak=False)
+
+            resp.set_etag(etag, weak=version is not None)
+            # (a route may know better, e.g. when streaming)
+            resp.headers.setdefault('Cache-Control', cache_control)
+            return resp
+        return handler
+    return wrapper
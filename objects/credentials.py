@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('CredentialCache',)
+
+import asyncio
+import hashlib
+import hmac
+import struct
+import sys
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import orjson
+from cmyui.logging import Ansi
+from cmyui.logging import log
+
+from objects.backends import CacheBackend
+from objects.utils import atomic_write
+
+# shared entries are the expiry (unix), then the digest.
+SHARED_ENTRY = struct.Struct('<d')
+
+
+class CredentialCache:
+    """A bounded cache of verified bcrypt credentials.
+
+    Rather than the md5 of a password, an HMAC of it (keyed with
+    the app's secret key) is kept for each bcrypt hash, so neither
+    memory nor the on-disk copy hold anything password-equivalent
+    without the key. Entries expire after `ttl` seconds, and the
+    least recently used are evicted past `max_size`.
+
+    If a shared `backend` is given, entries are written through to
+    it, and local misses are looked up there; so a login verified by
+    one worker skips bcrypt on the others too.
+
+    If a `path` is given, the cache is persisted there (signed, and
+    only readable by us) so it survives restarts; workers sharing
+    the same path merge their entries whenever they `sync()`."""
+
+    def __init__(self, secret: str, max_size: int, ttl: int,
+                 path: Optional[str] = None,
+                 backend: Optional[CacheBackend] = None) -> None:
+        self.key = hashlib.sha256(secret.encode()).digest()
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.backend = backend
+
+        # {pw_bcrypt: (expires_at (unix), hmac(pw_md5))}
+        self.entries: OrderedDict[bytes, tuple[float, bytes]] = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _digest(self, pw_md5: bytes) -> bytes:
+        return hmac.new(self.key, pw_md5, hashlib.sha256).digest()
+
+    def _backend_key(self, pw_bcrypt: bytes) -> str:
+        # don't hand the bcrypt hashes themselves to the backend.
+        return 'bcrypt:' + hmac.new(self.key, pw_bcrypt, hashlib.sha256).hexdigest()
+
+    async def _fetch_shared(self, pw_bcrypt: bytes) -> Optional[tuple[float, bytes]]:
+        if (
+            self.backend is None or
+            (data := await self.backend.get(self._backend_key(pw_bcrypt))) is None
+        ):
+            return None
+
+        expires_at, = SHARED_ENTRY.unpack_from(data)
+        entry = (expires_at, data[SHARED_ENTRY.size:])
+        self._insert(pw_bcrypt, *entry)
+        return entry
+
+    async def verify(self, pw_bcrypt: bytes, pw_md5: bytes) -> Optional[bool]:
+        """Check `pw_md5` against a cached `pw_bcrypt`.
+        Returns `None` if it isn't cached (i.e. bcrypt must be used)."""
+        if (
+            (entry := self.entries.get(pw_bcrypt)) is None and
+            (entry := await self._fetch_shared(pw_bcrypt)) is None
+        ):
+            self.misses += 1
+            return None
+
+        expires_at, digest = entry
+        if expires_at < time.time():
+            self.entries.pop(pw_bcrypt, None)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(pw_bcrypt)
+        return hmac.compare_digest(digest, self._digest(pw_md5))
+
+    async def set(self, pw_bcrypt: bytes, pw_md5: bytes) -> None:
+        """Cache a credential which bcrypt has verified."""
+        expires_at = time.time() + self.ttl
+        digest = self._digest(pw_md5)
+        self._insert(pw_bcrypt, expires_at, digest)
+
+        if self.backend is not None:
+            await self.backend.set(self._backend_key(pw_bcrypt),
+                                   SHARED_ENTRY.pack(expires_at) + digest,
+                                   self.ttl)
+
+    def _insert(self, pw_bcrypt: bytes, expires_at: float,
+                digest: bytes) -> None:
+        self.entries[pw_bcrypt] = (expires_at, digest)
+        self.entries.move_to_end(pw_bcrypt)
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    async def remove(self, pw_bcrypt: bytes) -> None:
+        self.entries.pop(pw_bcrypt, None)
+
+        if self.backend is not None:
+            await self.backend.delete(self._backend_key(pw_bcrypt))
+
+    @property
+    def memory_usage(self) -> int:
+        """Approximate memory held by the cache's entries, in bytes."""
+        if not self.entries:
+            return sys.getsizeof(self.entries)
+
+        pw_bcrypt, entry = next(iter(self.entries.items()))
+        per_entry = (sys.getsizeof(pw_bcrypt) + sys.getsizeof(entry) +
+                     sys.getsizeof(entry[0]) + sys.getsizeof(entry[1]))
+        return sys.getsizeof(self.entries) + per_entry * len(self.entries)
+
+    @property
+    def stats(self) -> dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'memory': self.memory_usage
+        }
+
+    """ persistence """
+
+    def _read(self) -> dict[bytes, tuple[float, bytes]]:
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return {}
+
+        signature, payload = data[:32], data[32:]
+        expected = hmac.new(self.key, payload, hashlib.sha256).digest()
+        if not hmac.compare_digest(signature, expected):
+            log('Ignoring bcrypt cache on disk: bad signature.', Ansi.LRED)
+            return {}
+
+        now = time.time()
+        return {
+            pw_bcrypt.encode(): (expires_at, bytes.fromhex(digest))
+            for pw_bcrypt, expires_at, digest in orjson.loads(payload)
+            if expires_at > now
+        }
+
+    def _dump(self) -> bytes:
+        payload = orjson.dumps([
+            (pw_bcrypt.decode(), expires_at, digest.hex())
+            for pw_bcrypt, (expires_at, digest) in self.entries.items()
+        ])
+        signature = hmac.new(self.key, payload, hashlib.sha256).digest()
+        return signature + payload
+
+    def _write(self, data: bytes) -> None:
+        # private (0600), and swapped in place so
+        # readers never see a partial cache.
+        atomic_write(self.path, data, mode=0o600)
+
+    async def sync(self) -> None:
+        """Merge with, and write back to, the on-disk cache."""
+        if self.path is None:
+            return
+
+        on_disk = await asyncio.to_thread(self._read)
+
+        # merge entries other workers have persisted with
+        # our own, treating theirs as least recently used.
+        for pw_bcrypt, (expires_at, digest) in on_disk.items():
+            if pw_bcrypt not in self.entries:
+                self.entries[pw_bcrypt] = (expires_at, digest)
+                self.entries.move_to_end(pw_bcrypt, last=False)
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+        await asyncio.to_thread(self._write, self._dump())
+
+    async def run(self, interval: int) -> None:
+        """Sync with the on-disk cache every `interval` seconds."""
+        while True:
+            await asyncio.sleep(interval)
+
+            try:
+                await self.sync()
+            except Exception as exc:
+                log(f'Failed to sync bcrypt cache: {exc}', Ansi.LRED)
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('DashboardSnapshot',)
+
+import asyncio
+import time
+
+from cmyui.logging import Ansi
+from cmyui.logging import log
+
+from objects import glob
+
+
+class DashboardSnapshot:
+    """The admin dashboard's aggregates, recomputed in the background.
+
+    Rendering the dashboard only reads the last snapshot, so staff
+    keeping the page open no longer cause repeated table scans."""
+
+    __slots__ = ('counts', 'recent_users', 'recent_scores',
+                 'computed_at', 'min_interval', '_lock')
+
+    def __init__(self, min_interval: int) -> None:
+        self.counts: dict = {}
+        self.recent_users: list[dict] = []
+        self.recent_scores: list[dict] = []
+        self.computed_at = 0.0
+
+        # forced refreshes are ignored if the
+        # snapshot is younger than this (seconds).
+        self.min_interval = min_interval
+        self._lock = asyncio.Lock()
+
+    async def refresh(self, force: bool = False) -> None:
+        """Recompute the snapshot; `force` skips the background schedule,
+        though concurrent refreshes still only run the queries once."""
+        computed_at = self.computed_at
+
+        async with self._lock:
+            if self.computed_at != computed_at:
+                return  # refreshed while we waited for the lock
+
+            if force and time.time() - self.computed_at < self.min_interval:
+                return
+
+            # count users & banned users in a single pass.
+            counts, recent_users, recent_scores = await asyncio.gather(
+                glob.db.fetch(
+                    'SELECT COUNT(id) count, '
+                    'CAST(SUM(NOT priv & 1) AS UNSIGNED) banned '
+                    'FROM users'
+                ),
+                glob.db.fetchall(
+                    'SELECT id, name, email, priv, country, '
+                    'creation_time, latest_activity '
+                    'FROM users ORDER BY id DESC LIMIT 5'
+                ),
+                glob.db.fetchall(
+                    'SELECT scores_vn.*, maps.artist, maps.title, '
+                    'maps.set_id, maps.creator, maps.version '
+                    'FROM scores_vn JOIN maps ON scores_vn.map_md5 = maps.md5 '
+                    'ORDER BY scores_vn.id DESC LIMIT 5'
+                )
+            )
+
+            self.counts = {
+                'count': counts['count'],
+                'banned': counts['banned'] or 0,
+                'lastest_user': recent_users[0]['name'] if recent_users else None
+            }
+            self.recent_users = recent_users
+            self.recent_scores = recent_scores
+            self.computed_at = time.time()
+
+    async def run(self, interval: int) -> None:
+        """Refresh the snapshot every `interval` seconds."""
+        while True:
+            await asyncio.sleep(interval)
+
+            try:
+                await self.refresh()
+            except Exception as exc:
+                log(f'Failed to refresh dashboard: {exc}', Ansi.LRED)
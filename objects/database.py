@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('PoolTimeout', 'SQLPool', 'RoutedSQLPool',
+           'read_from_replicas', 'pin_to_primary')
+
+import asyncio
+import contextlib
+import contextvars
+import itertools
+import time
+from typing import Any
+from typing import AsyncIterator
+from typing import Iterable
+from typing import Optional
+
+import aiomysql
+from cmyui.logging import Ansi
+from cmyui.logging import log
+from quart import current_app
+from quart import request
+from quart import session
+
+from objects import glob
+
+
+class PoolTimeout(Exception):
+    """Raised when no database connection frees up in time."""
+
+
+class SQLPool:
+    """A pool of connections to a single mysql server.
+
+    Acquiring a connection gives up after `acquire_timeout` seconds
+    (raising `PoolTimeout`), and every query & acquire is reported
+    to `glob.metrics`."""
+
+    def __init__(self, name: str, acquire_timeout: float) -> None:
+        self.name = name
+        self.acquire_timeout = acquire_timeout
+        self.pool: Optional[aiomysql.Pool] = None
+
+        # cleared by a failed health check; an unhealthy
+        # replica isn't used until it passes one again.
+        self.healthy = True
+
+    async def connect(self, config: dict[str, Any], minsize: int,
+                      maxsize: int, recycle: int) -> None:
+        self.pool = await aiomysql.create_pool(
+            minsize=minsize, maxsize=maxsize, pool_recycle=recycle,
+            autocommit=True, **config
+        )
+
+    async def close(self) -> None:
+        self.pool.close()
+        await self.pool.wait_closed()
+
+    async def _acquire(self) -> aiomysql.Connection:
+        # not `wait_for`; a connection acquired just as it times out
+        # (or as we're cancelled) would never be released.
+        task = asyncio.ensure_future(self.pool.acquire())
+        try:
+            done, _ = await asyncio.wait((task,), timeout=self.acquire_timeout)
+        except asyncio.CancelledError:
+            self._abandon(task)
+            raise
+
+        if not done:
+            self._abandon(task)
+            raise asyncio.TimeoutError
+
+        return task.result()
+
+    def _abandon(self, task: asyncio.Task) -> None:
+        """Give up on an acquire; release its connection if it gets one anyway."""
+        def release(task: asyncio.Task) -> None:
+            if not task.cancelled() and task.exception() is None:
+                self.pool.release(task.result())
+
+        task.cancel()
+        task.add_done_callback(release)
+
+    @contextlib.asynccontextmanager
+    async def acquire(self) -> AsyncIterator[aiomysql.Connection]:
+        start = time.perf_counter()
+        try:
+            conn = await self._acquire()
+        except asyncio.TimeoutError:
+            glob.metrics.observe_acquire(self.name, time.perf_counter() - start,
+                                         timed_out=True)
+            raise PoolTimeout(f'No {self.name} connection within '
+                              f'{self.acquire_timeout}s.')
+
+        glob.metrics.observe_acquire(self.name, time.perf_counter() - start)
+        try:
+            yield conn
+        except (asyncio.CancelledError, asyncio.TimeoutError,
+                aiomysql.OperationalError, aiomysql.InterfaceError):
+            # the connection may be mid-query (if we were cancelled),
+            # or broken; don't hand it out again. ordinary sql errors
+            # leave it usable, so it goes back to the pool as usual.
+            conn.close()
+            raise
+        finally:
+            self.pool.release(conn)
+
+    async def _query(self, query: str, params: Optional[list],
+                     _all: bool, _dict: bool) -> Any:
+        cursor_type = aiomysql.DictCursor if _dict else aiomysql.Cursor
+
+        async with self.acquire() as conn:
+            async with conn.cursor(cursor_type) as cursor:
+                start = time.perf_counter()
+                await cursor.execute(query, params)
+                res = await (cursor.fetchall() if _all else cursor.fetchone())
+                elapsed = time.perf_counter() - start
+
+        if _all:
+            rows = len(res)
+        else:
+            rows = 1 if res is not None else 0
+
+        glob.metrics.observe_query(query, elapsed, rows)
+        return res
+
+    async def fetch(self, query: str, params: Optional[list] = None,
+                    _dict: bool = True) -> Any:
+        return await self._query(query, params, _all=False, _dict=_dict)
+
+    async def fetchall(self, query: str, params: Optional[list] = None,
+                       _dict: bool = True) -> Any:
+        return await self._query(query, params, _all=True, _dict=_dict)
+
+    async def execute(self, query: str, params: Optional[list] = None) -> int:
+        async with self.acquire() as conn:
+            async with conn.cursor() as cursor:
+                start = time.perf_counter()
+                await cursor.execute(query, params)
+                elapsed = time.perf_counter() - start
+                lastrowid = cursor.lastrowid
+
+        glob.metrics.observe_query(query, elapsed, 0)
+        return lastrowid
+
+    async def health_check(self) -> bool:
+        try:
+            async with self.acquire() as conn:
+                async with conn.cursor() as cursor:
+                    await asyncio.wait_for(cursor.execute('SELECT 1'),
+                                           self.acquire_timeout)
+        except Exception as exc:
+            if self.healthy:
+                log(f'MySQL {self.name} failed a health check: {exc!r}.', Ansi.LRED)
+            self.healthy = False
+        else:
+            if not self.healthy:
+                log(f'MySQL {self.name} is healthy again.', Ansi.LGREEN)
+            self.healthy = True
+
+        return self.healthy
+
+    @property
+    def stats(self) -> dict[str, float]:
+        return {
+            'size': self.pool.size,
+            'free': self.pool.freesize,
+            'max_size': self.pool.maxsize,
+            'healthy': int(self.healthy)
+        }
+
+
+# whether reads in the current context may go to a replica;
+# set per-request by the blueprints whose reads can lag a little.
+use_replicas: contextvars.ContextVar[bool] = \
+    contextvars.ContextVar('use_replicas', default=False)
+
+
+def read_from_replicas() -> None:
+    """Route this request's reads to the replicas, unless the
+    player recently wrote something they'd expect to read back."""
+    if current_app.config['SESSION_COOKIE_NAME'] not in request.cookies:
+        # no session to look in; & not touching it keeps
+        # quart from adding `Vary: Cookie` to the response.
+        use_replicas.set(True)
+        return
+
+    use_replicas.set(session.get('primary_until', 0) < time.time())
+
+
+def pin_to_primary() -> None:
+    """Keep the player's reads on the primary for a while after a
+    write, so they don't read stale data from a lagging replica."""
+    session['primary_until'] = time.time() + glob.config.replica_pin_time
+
+
+class RoutedSQLPool:
+    """A primary mysql pool, and any number of read replicas.
+
+    Writes always go to the primary; reads go to the healthy
+    replicas in turn when `use_replicas` is set, and to the
+    primary otherwise (or when no replica is healthy)."""
+
+    def __init__(self, acquire_timeout: float) -> None:
+        self.primary = SQLPool('primary', acquire_timeout)
+        self.replicas: list[SQLPool] = []
+        self.acquire_timeout = acquire_timeout
+        self._next_replica = itertools.count()
+
+    async def connect(self, config: dict[str, Any],
+                      replicas: Iterable[dict[str, Any]] = (),
+                      minsize: int = 1, maxsize: int = 10,
+                      recycle: int = -1) -> None:
+        await self.primary.connect(config, minsize, maxsize, recycle)
+
+        for idx, replica_config in enumerate(replicas):
+            replica = SQLPool(f'replica{idx}', self.acquire_timeout)
+            await replica.connect(replica_config, minsize, maxsize, recycle)
+            self.replicas.append(replica)
+
+    async def close(self) -> None:
+        for pool in self.pools:
+            await pool.close()
+
+    @property
+    def pools(self) -> list[SQLPool]:
+        return [self.primary] + self.replicas
+
+    @property
+    def pool(self) -> aiomysql.Pool:
+        # for callers which need a raw connection (e.g. transactions).
+        return self.primary.pool
+
+    @property
+    def reader(self) -> SQLPool:
+        if use_replicas.get():
+            if healthy := [r for r in self.replicas if r.healthy]:
+                return healthy[next(self._next_replica) % len(healthy)]
+
+        return self.primary
+
+    async def fetch(self, query: str, params: Optional[list] = None,
+                    _dict: bool = True) -> Any:
+        return await self.reader.fetch(query, params, _dict)
+
+    async def fetchall(self, query: str, params: Optional[list] = None,
+                       _dict: bool = True) -> Any:
+        return await self.reader.fetchall(query, params, _dict)
+
+    async def execute(self, query: str, params: Optional[list] = None) -> int:
+        return await self.primary.execute(query, params)
+
+    async def health_check(self) -> None:
+        await asyncio.gather(*[pool.health_check() for pool in self.pools])
+
+    async def run(self, interval: int) -> None:
+        """Health check each pool every `interval` seconds."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.health_check()
+            except Exception as exc:
+                log(f'Failed to health check mysql pools: {exc!r}.', Ansi.LRED)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('Doc', 'DocsIndex')
+
+import asyncio
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import markdown2
+from cmyui.logging import Ansi
+from cmyui.logging import log
+
+
+@dataclass
+class Doc:
+    """A pre-rendered markdown document."""
+    name: str
+    html: str
+    mtime: float
+    etag: str
+
+
+class DocsIndex:
+    """Renders every markdown file in a directory ahead of time.
+
+    Files are only re-rendered when their mtime changes, so
+    serving a doc is a dictionary lookup (and names which
+    aren't in the index never reach the filesystem)."""
+
+    __slots__ = ('path', 'docs')
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.docs: dict[str, Doc] = {}
+
+    def get(self, name: str) -> Optional[Doc]:
+        return self.docs.get(name.lower())
+
+    @property
+    def names(self) -> list[str]:
+        return sorted(self.docs)
+
+    def _scan(self) -> dict[str, tuple[str, float]]:
+        # {name: (path, mtime)}
+        files = {}
+
+        for entry in os.scandir(self.path):
+            name, ext = os.path.splitext(entry.name)
+            if ext == '.md' and entry.is_file():
+                files[name.lower()] = (entry.path, entry.stat().st_mtime)
+
+        return files
+
+    @staticmethod
+    def _render(name: str, path: str, mtime: float) -> Doc:
+        html = markdown2.markdown_path(path)
+        etag = hashlib.sha1(html.encode()).hexdigest()
+        return Doc(name, html, mtime, etag)
+
+    async def refresh(self) -> None:
+        """(Re-)render any new or changed docs, and forget deleted ones."""
+        files = await asyncio.to_thread(self._scan)
+
+        for name in self.docs.keys() - files.keys():
+            del self.docs[name]
+
+        for name, (path, mtime) in files.items():
+            if (doc := self.docs.get(name)) and doc.mtime == mtime:
+                continue  # unchanged
+
+            self.docs[name] = await asyncio.to_thread(
+                self._render, name, path, mtime)
+
+    async def run(self, interval: int) -> None:
+        """Check for changed docs every `interval` seconds."""
+        while True:
+            await asyncio.sleep(interval)
+
+            try:
+                await self.refresh()
+            except Exception as exc:
+                log(f'Failed to refresh docs: {exc}', Ansi.LRED)
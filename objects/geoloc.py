@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('GeoDatabase', 'GeoResolver', 'build_database')
+
+import array
+import asyncio
+import bisect
+import csv
+import ipaddress
+import mmap
+import struct
+import sys
+import time
+from collections import OrderedDict
+from typing import Iterable
+from typing import Optional
+
+import aiohttp
+from cmyui.logging import Ansi
+from cmyui.logging import log
+
+from objects import glob
+
+# file layout: header, then `count` start addresses (u32),
+# `count` end addresses (u32), and `count` country codes (2 bytes);
+# ranges are sorted and don't overlap. all integers are little-endian.
+MAGIC = b'GEO1'
+HEADER = struct.Struct('<4sI')
+
+
+def _ip_to_int(ip: str) -> Optional[int]:
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return None
+
+    if addr.version != 4:
+        return None  # only ipv4 is stored locally
+
+    return int(addr)
+
+
+def build_database(rows: Iterable[tuple[str, str, str]], path: str) -> int:
+    """Write an ip range database from (start, end, country) rows,
+    where start & end are either dotted ipv4 addresses or integers.
+    Returns the number of ranges written."""
+    ranges = []
+
+    for start, end, country in rows:
+        start = int(start) if start.isdigit() else _ip_to_int(start)
+        end = int(end) if end.isdigit() else _ip_to_int(end)
+
+        if start is None or end is None or len(country) != 2:
+            continue  # ipv6 or malformed
+
+        ranges.append((start, end, country.lower().encode()))
+
+    ranges.sort()
+
+    starts = array.array('I', (r[0] for r in ranges))
+    ends = array.array('I', (r[1] for r in ranges))
+    if sys.byteorder != 'little':
+        starts.byteswap()
+        ends.byteswap()
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(ranges)))
+        f.write(starts.tobytes())
+        f.write(ends.tobytes())
+        f.write(b''.join(r[2] for r in ranges))
+
+    return len(ranges)
+
+
+class GeoDatabase:
+    """A memory-mapped ip range -> country database (see `build_database`).
+
+    Lookups binary search the (mapped) array of range starts,
+    so the file is never read into memory as python objects."""
+
+    def __init__(self, path: str) -> None:
+        with open(path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.count = HEADER.unpack_from(self.mmap)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a geolocation database')
+
+        if sys.byteorder != 'little':
+            raise RuntimeError('geolocation databases require a little-endian host')
+
+        view = memoryview(self.mmap)
+        offset = HEADER.size
+        self.starts = view[offset:offset + self.count * 4].cast('I')
+        offset += self.count * 4
+        self.ends = view[offset:offset + self.count * 4].cast('I')
+        offset += self.count * 4
+        self.countries = view[offset:offset + self.count * 2]
+
+    def lookup(self, ip: str) -> Optional[str]:
+        if (addr := _ip_to_int(ip)) is None:
+            return None
+
+        # the last range starting at or before `addr`.
+        if (idx := bisect.bisect_right(self.starts, addr) - 1) < 0:
+            return None
+
+        if addr > self.ends[idx]:
+            return None  # falls in a gap between ranges
+
+        return bytes(self.countries[idx * 2:idx * 2 + 2]).decode()
+
+
+class GeoResolver:
+    """Resolves ips to (lowercase) country codes.
+
+    The local database is tried first, then an LRU+TTL cache, and
+    only then the remote provider, within a timeout budget; 'xx'
+    is returned for anything we can't resolve."""
+
+    def __init__(self, db: Optional[GeoDatabase], max_size: int,
+                 ttl: int, timeout: float) -> None:
+        self.db = db
+        self.max_size = max_size
+        self.ttl = ttl
+        self.timeout = timeout
+
+        # {ip: (expires_at, country)}
+        self.cache: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    def _cached(self, ip: str) -> Optional[str]:
+        if (entry := self.cache.get(ip)) is None:
+            return None
+
+        if entry[0] < time.monotonic():
+            del self.cache[ip]
+            return None
+
+        self.cache.move_to_end(ip)
+        return entry[1]
+
+    def _store(self, ip: str, country: str) -> None:
+        self.cache[ip] = (time.monotonic() + self.ttl, country)
+        self.cache.move_to_end(ip)
+
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+
+    def resolve_local(self, ip: str) -> Optional[str]:
+        if self.db is not None and (country := self.db.lookup(ip)):
+            return country
+        return self._cached(ip)
+
+    async def _fetch_remote(self, ips: list[str]) -> dict[str, str]:
+        url = 'http://ip-api.com/batch?fields=status,countryCode,query'
+
+        async with glob.http.post(url, json=ips) as resp:
+            if not resp or resp.status != 200:
+                if glob.config.debug:
+                    log('Failed to get geoloc data: request failed.', Ansi.LRED)
+                return {}
+
+            return {
+                res['query']: res['countryCode'].lower()
+                for res in await resp.json()
+                if res['status'] == 'success'
+            }
+
+    async def resolve_many(self, ips: Iterable[str]) -> dict[str, str]:
+        """Resolve many ips, with (at most) one remote request."""
+        resolved = {}
+        missing = []
+
+        for ip in set(ips):
+            if (country := self.resolve_local(ip)) is not None:
+                resolved[ip] = country
+            else:
+                missing.append(ip)
+
+        if missing:
+            try:
+                remote = await asyncio.wait_for(
+                    self._fetch_remote(missing), self.timeout)
+            except (asyncio.TimeoutError, aiohttp.ClientError) as exc:
+                if glob.config.debug:
+                    log(f'Failed to get geoloc data: {exc!r}.', Ansi.LRED)
+                remote = {}
+
+            for ip in missing:
+                if ip in remote:
+                    self._store(ip, remote[ip])
+                resolved[ip] = remote.get(ip, 'xx')
+
+        return resolved
+
+    async def resolve(self, ip: str) -> str:
+        return (await self.resolve_many((ip,)))[ip]
+
+
+if __name__ == '__main__':
+    # usage: python3.9 -m objects.geoloc <ranges.csv> <output.db>
+    # where each csv row is `start,end,country` (e.g. a db-ip lite export).
+    with open(sys.argv[1], newline='') as f:
+        count = build_database(((row[0], row[1], row[2])
+                                for row in csv.reader(f)), sys.argv[2])
+    print(f'Wrote {count} ranges to {sys.argv[2]}.')
@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
 
-__all__ = ('db', 'http', 'version', 'cache')
+__all__ = ('db', 'http', 'version', 'cache', 'ranks', 'responses',
+           'watermarks', 'grades', 'hasher', 'docs',
+           'dashboard', 'metrics', 'most_played', 'beatmaps',
+           'geoloc', 'cache_backend', 'pages', 'assets',
+           'avatars', 'banners', 'players', 'rank_history')
 
 from typing import TYPE_CHECKING
 
@@ -8,13 +12,50 @@ import config  # imported for indirect use
 
 if TYPE_CHECKING:
     from aiohttp import ClientSession
-    from cmyui.mysql import AsyncSQLPool
     from cmyui.version import Version
 
-db: 'AsyncSQLPool'
+    from objects.assets import AssetManifest
+    from objects.backends import CacheBackend
+    from objects.beatmaps import BeatmapCache
+    from objects.cache import ResponseCache
+    from objects.dashboard import DashboardSnapshot
+    from objects.database import RoutedSQLPool
+    from objects.docs import DocsIndex
+    from objects.geoloc import GeoResolver
+    from objects.grades import GradeCache
+    from objects.hashing import HashPool
+    from objects.imagestore import ImageStore
+    from objects.metrics import Metrics
+    from objects.mostplayed import MostPlayed
+    from objects.pages import StaticPages
+    from objects.playersearch import PlayerIndex
+    from objects.rankhistory import RankHistory
+    from objects.rankings import RankIndex
+    from objects.watermarks import ScoreWatermarks
+
+db: 'RoutedSQLPool'
 http: 'ClientSession'
 version: 'Version'
+ranks: 'RankIndex'
+responses: 'ResponseCache'
+watermarks: 'ScoreWatermarks'
+grades: 'GradeCache'
+hasher: 'HashPool'
+docs: 'DocsIndex'
+dashboard: 'DashboardSnapshot'
+metrics: 'Metrics'
+most_played: 'MostPlayed'
+beatmaps: 'BeatmapCache'
+geoloc: 'GeoResolver'
+cache_backend: 'CacheBackend'
+pages: 'StaticPages'
+assets: 'AssetManifest'
+avatars: 'ImageStore'
+banners: 'ImageStore'
+players: 'PlayerIndex'
+rank_history: 'RankHistory'
 
 cache = {
-    'bcrypt': {}
+    # replaced by a `CredentialCache` before serving.
+    'bcrypt': None
 }
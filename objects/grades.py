@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('GRADES', 'GradeCache', 'count_grades')
+
+from collections import OrderedDict
+from typing import Optional
+
+from cmyui.logging import Ansi
+from cmyui.logging import log
+
+from objects import glob
+
+GRADES = ('x', 'xh', 's', 'sh', 'a')
+
+
+async def count_grades(id: int, mode: int, mods: str, after_id: int = 0,
+                       until_id: Optional[int] = None) -> dict[str, int]:
+    """Count a player's x/xh/s/sh/a grades in the database,
+    optionally only for scores with ids in (`after_id`, `until_id`]."""
+    q = [f'SELECT grade, COUNT(*) AS count FROM scores_{mods}',
+         f'WHERE mode = {mode} AND userid = %s AND id > %s']
+    args = [id, after_id]
+
+    if until_id is not None:
+        q.append('AND id <= %s')
+        args.append(until_id)
+
+    q.append('GROUP BY grade')
+    q = ' '.join(q)
+
+    if glob.config.debug:
+        log(q, Ansi.LMAGENTA)
+
+    grades = dict.fromkeys(GRADES, 0)
+
+    for row in await glob.db.fetchall(q, args):
+        # grades may be stored in either case.
+        if (grade := row['grade'].lower()) in grades:
+            grades[grade] += row['count']
+
+    return grades
+
+
+class GradeCache:
+    """A per-(user, mode, mods) cache of grade counts.
+
+    Each entry remembers the score id watermark it was counted
+    at; once the watermark moves, only the newer scores are
+    counted and added to it, and while it stays still repeat
+    lookups don't touch the scores tables at all."""
+
+    __slots__ = ('entries', 'max_size')
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        # {(id, mode, mods): (watermark, grades)}
+        self.entries: OrderedDict[tuple[int, int, str],
+                                  tuple[int, dict[str, int]]] = OrderedDict()
+
+    def invalidate(self, id: Optional[int] = None) -> None:
+        """Drop a user's entries, or every entry if no id is given."""
+        if id is None:
+            self.entries.clear()
+        else:
+            for key in [k for k in self.entries if k[0] == id]:
+                del self.entries[key]
+
+    async def get(self, id: int, mode: int, mods: str) -> dict[str, int]:
+        key = (id, mode, mods)
+        watermark = glob.watermarks.get(mods)
+
+        if not watermark:
+            # we don't know where the scores table is at yet.
+            return await count_grades(id, mode, mods)
+
+        if (entry := self.entries.get(key)) is not None:
+            counted_at, grades = entry
+
+            if counted_at < watermark:
+                # count only the scores submitted since.
+                new = await count_grades(id, mode, mods,
+                                         counted_at, watermark)
+                grades = {g: grades[g] + new[g] for g in GRADES}
+        else:
+            grades = await count_grades(id, mode, mods,
+                                        until_id=watermark)
+
+        self.entries[key] = (watermark, grades)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+        return grades
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('PoolSaturated', 'HashPool')
+
+import asyncio
+import time
+from concurrent.futures import Executor
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import Callable
+
+import bcrypt
+
+
+class PoolSaturated(Exception):
+    """Raised when too many hashes are already waiting for a worker."""
+
+
+def _timed(func: Callable, *args: Any) -> tuple[float, float, Any]:
+    # runs in the worker; wall clock times are used
+    # as they're comparable across processes.
+    started = time.time()
+    res = func(*args)
+    return started, time.time(), res
+
+
+def _hashpw(pw: bytes) -> bytes:
+    return bcrypt.hashpw(pw, bcrypt.gensalt())
+
+
+class HashPool:
+    """Runs bcrypt off the event loop, in a thread or process pool.
+
+    At most `max_pending` calls may be in flight (running or queued)
+    at once; past that, `PoolSaturated` is raised immediately rather
+    than letting the queue (and every login's latency) grow."""
+
+    def __init__(self, kind: str, workers: int, max_pending: int) -> None:
+        if kind == 'process':
+            self.executor: Executor = ProcessPoolExecutor(workers)
+        else:
+            self.executor = ThreadPoolExecutor(
+                workers, thread_name_prefix='bcrypt')
+
+        self.max_pending = max_pending
+        self.pending = 0
+
+        self.calls = 0
+        self.rejected = 0
+        self.wait_time = 0.0  # total seconds queued
+        self.hash_time = 0.0  # total seconds hashing
+        self.max_wait_time = 0.0
+
+    async def _run(self, func: Callable, *args: Any) -> Any:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PoolSaturated
+
+        self.pending += 1
+        try:
+            submitted = time.time()
+            started, finished, res = await asyncio.get_running_loop(
+            ).run_in_executor(self.executor, _timed, func, *args)
+        finally:
+            self.pending -= 1
+
+        wait_time = max(started - submitted, 0.0)
+        self.calls += 1
+        self.wait_time += wait_time
+        self.hash_time += finished - started
+        self.max_wait_time = max(self.max_wait_time, wait_time)
+
+        return res
+
+    async def checkpw(self, pw: bytes, hashed: bytes) -> bool:
+        return await self._run(bcrypt.checkpw, pw, hashed)
+
+    async def hashpw(self, pw: bytes) -> bytes:
+        return await self._run(_hashpw, pw)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False)
+
+    @property
+    def stats(self) -> dict[str, float]:
+        return {
+            'pending': self.pending,
+            'calls': self.calls,
+            'rejected': self.rejected,
+            'avg_wait_time': self.wait_time / self.calls if self.calls else 0.0,
+            'max_wait_time': self.max_wait_time,
+            'avg_hash_time': self.hash_time / self.calls if self.calls else 0.0
+        }
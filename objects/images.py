@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('InvalidImage', 'save_upload')
+
+import asyncio
+import glob as globlib
+import io
+import os
+from typing import Sequence
+
+from PIL import Image
+from PIL import ImageOps
+from PIL import ImageSequence
+from PIL import UnidentifiedImageError
+
+from objects.utils import atomic_write
+
+# refuse to decode anything larger than this; guards
+# against decompression bombs disguised as avatars.
+MAX_PIXELS = 4096 * 4096
+
+# animations are decoded & resized frame by frame, so they're
+# also limited by frame count, and by pixels across all frames.
+MAX_FRAMES = 64
+MAX_ANIMATION_PIXELS = 4096 * 4096
+
+# stored extensions; anything else on disk for a user is stale.
+EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif')
+
+
+class InvalidImage(Exception):
+    """Raised when an upload isn't an image we'll accept."""
+
+
+def _encode(frames: list[Image.Image], durations: list[int],
+            loop: int) -> tuple[bytes, str]:
+    """Encode (resized) frames in the most efficient suitable format."""
+    buf = io.BytesIO()
+
+    if len(frames) > 1:
+        frames[0].save(buf, 'GIF', save_all=True, append_images=frames[1:],
+                       duration=durations, loop=loop, optimize=True,
+                       disposal=2)
+        return buf.getvalue(), '.gif'
+
+    img = frames[0]
+    if img.mode in ('RGBA', 'LA', 'P'):
+        # keep transparency.
+        img.save(buf, 'PNG', optimize=True)
+        return buf.getvalue(), '.png'
+
+    img.convert('RGB').save(buf, 'JPEG', quality=90,
+                            optimize=True, progressive=True)
+    return buf.getvalue(), '.jpg'
+
+
+def _process(data: bytes, sizes: Sequence[tuple[int, int]],
+             allow_animated: bool) -> list[tuple[bytes, str]]:
+    """Validate an upload, and encode it once for each of `sizes`."""
+    try:
+        return _resize(data, sizes, allow_animated)
+    except Image.DecompressionBombError:
+        raise InvalidImage('image too large')
+
+
+def _resize(data: bytes, sizes: Sequence[tuple[int, int]],
+            allow_animated: bool) -> list[tuple[bytes, str]]:
+    try:
+        # verify() checks the file's integrity, but leaves
+        # the image unusable; it must be opened again after.
+        with Image.open(io.BytesIO(data)) as img:
+            img.verify()
+
+        img = Image.open(io.BytesIO(data))
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        raise InvalidImage('not an image')
+
+    allowed = {'PNG', 'JPEG'}
+    if allow_animated:
+        allowed.add('GIF')
+
+    if img.format not in allowed:
+        raise InvalidImage(f'unsupported format ({img.format})')
+
+    if img.width * img.height > MAX_PIXELS:
+        raise InvalidImage('image too large')
+
+    if getattr(img, 'is_animated', False) and allow_animated:
+        # (counted from frame headers, before any are decoded)
+        n_frames = img.n_frames
+        if (
+            n_frames > MAX_FRAMES or
+            n_frames * img.width * img.height > MAX_ANIMATION_PIXELS
+        ):
+            raise InvalidImage('animation too large')
+
+        frames = ImageSequence.Iterator(img)
+    else:
+        # (only the first frame of an animated png, if not allowed.)
+        frames = [ImageOps.exif_transpose(img)]
+
+    # resize each frame as it's decoded, keeping only the results.
+    resized = [[] for _ in sizes]
+    durations = []
+
+    for frame in frames:
+        durations.append(frame.info.get('duration', 100))
+        if frame.mode == 'P':
+            frame = frame.convert('RGBA')
+
+        for size, variant in zip(sizes, resized):
+            variant.append(ImageOps.fit(frame, size, Image.LANCZOS))
+
+    if len(durations) == 1:
+        durations = []
+
+    loop = img.info.get('loop', 0)
+    return [_encode(variant, durations, loop) for variant in resized]
+
+
+def _store(directory: str, name: str, sizes: Sequence[tuple[int, int]],
+           variants: list[tuple[bytes, str]]) -> None:
+    # the first size is stored as `{name}{ext}`,
+    # with the rest as `{name}_{w}x{h}{ext}`.
+    paths = [f'{directory}/{name}{variants[0][1]}']
+    for (width, height), (_, ext) in zip(sizes[1:], variants[1:]):
+        paths.append(f'{directory}/{name}_{width}x{height}{ext}')
+
+    for path, (data, _) in zip(paths, variants):
+        atomic_write(path, data)
+
+    # remove anything left over from previous uploads.
+    for path in globlib.glob(f'{directory}/{name}.*') + \
+            globlib.glob(f'{directory}/{name}_*x*.*'):
+        if path not in paths and path.endswith(EXTENSIONS):
+            os.remove(path)
+
+
+def _save_upload(data: bytes, directory: str, name: str,
+                 sizes: Sequence[tuple[int, int]],
+                 allow_animated: bool) -> None:
+    _store(directory, name, sizes, _process(data, sizes, allow_animated))
+
+
+async def save_upload(data: bytes, directory: str, name: str,
+                      sizes: Sequence[tuple[int, int]],
+                      allow_animated: bool = False) -> None:
+    """Validate, resize & re-encode an uploaded image, then
+    atomically write it to `directory` once for each of `sizes`.
+
+    Runs in a thread, as decoding & encoding are CPU-bound."""
+    await asyncio.to_thread(_save_upload, data, directory, name,
+                            sizes, allow_animated)
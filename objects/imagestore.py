@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('ImageStore',)
+
+import asyncio
+import datetime
+import mimetypes
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from quart import Response
+from quart import request
+from quart import send_file
+
+from objects.images import EXTENSIONS
+
+
+class StoredImage:
+    __slots__ = ('path', 'size', 'mtime', 'inode', 'etag', 'mimetype')
+
+    def __init__(self, path: str, stat: os.stat_result) -> None:
+        self.path = path
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.inode = stat.st_ino
+        self.etag = f'{stat.st_mtime_ns:x}-{stat.st_size:x}'
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    def unchanged(self, stat: os.stat_result) -> bool:
+        # (uploads are swapped in, so a new one is a new inode.)
+        return (stat.st_ino == self.inode and
+                f'{stat.st_mtime_ns:x}-{stat.st_size:x}' == self.etag)
+
+
+class ImageStore:
+    """Serves the images stored (by `images.save_upload`) in a directory.
+
+    Which file (i.e. extension) each name maps to is resolved once and
+    kept in an index for `index_ttl` seconds; each use is checked with
+    a stat (of the file, or the directory if there was none), so an
+    upload handled by another worker is picked up. Files up to `max_file`
+    bytes are served from an LRU bounded to `max_bytes` in total, and
+    larger ones from disk; by nginx (with sendfile) if `accel_prefix`
+    is set, as an X-Accel-Redirect to `{accel_prefix}/{file}`."""
+
+    def __init__(self, directory: str, fallback: str, index_size: int,
+                 index_ttl: int, max_bytes: int, max_file: int,
+                 max_age: int, accel_prefix: Optional[str] = None) -> None:
+        self.directory = directory
+        self.fallback = StoredImage(fallback, os.stat(fallback))
+        self.index_size = index_size
+        self.index_ttl = index_ttl
+        self.max_bytes = max_bytes
+        self.max_file = max_file
+        self.cache_control = f'public, max-age={max_age}'
+        self.accel_prefix = accel_prefix
+
+        # {name: (expires_at, image (or None if there's none stored),
+        #         the directory's mtime when it was resolved)}
+        self.index: OrderedDict[str, tuple[float, Optional[StoredImage], int]] = OrderedDict()
+        # {path: (etag, data)}
+        self.data: OrderedDict[str, tuple[str, bytes]] = OrderedDict()
+        self.data_size = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def _fresh(self, image: Optional[StoredImage], dir_mtime: int) -> bool:
+        try:
+            if image is None:
+                return os.stat(self.directory).st_mtime_ns == dir_mtime
+            return image.unchanged(os.stat(image.path))
+        except FileNotFoundError:
+            return False
+
+    def _resolve(self, name: str) -> Optional[StoredImage]:
+        now = time.monotonic()
+
+        if (
+            (entry := self.index.get(name)) is not None and
+            entry[0] > now and self._fresh(entry[1], entry[2])
+        ):
+            self.index.move_to_end(name)
+            return entry[1]
+
+        # (taken first, so an upload made while we look is picked up.)
+        dir_mtime = os.stat(self.directory).st_mtime_ns
+
+        image = None
+        for ext in EXTENSIONS:
+            path = f'{self.directory}/{name}{ext}'
+            try:
+                image = StoredImage(path, os.stat(path))
+            except FileNotFoundError:
+                continue
+            break
+
+        self.index[name] = (now + self.index_ttl, image, dir_mtime)
+        self.index.move_to_end(name)
+
+        while len(self.index) > self.index_size:
+            self.index.popitem(last=False)
+
+        return image
+
+    def invalidate(self, id: int) -> None:
+        """Forget everything about `id`'s images (e.g. after an upload)."""
+        for name in [n for n in self.index
+                     if n == str(id) or n.startswith(f'{id}_')]:
+            _, image, _ = self.index.pop(name)
+
+            if image is not None and image.path in self.data:
+                self.data_size -= len(self.data.pop(image.path)[1])
+
+    async def _read(self, image: StoredImage) -> bytes:
+        if (entry := self.data.get(image.path)) is not None and entry[0] == image.etag:
+            self.hits += 1
+            self.data.move_to_end(image.path)
+            return entry[1]
+
+        self.misses += 1
+        data = await asyncio.to_thread(_read_file, image.path)
+
+        if (old := self.data.pop(image.path, None)) is not None:
+            self.data_size -= len(old[1])
+
+        self.data[image.path] = (image.etag, data)
+        self.data_size += len(data)
+
+        while self.data_size > self.max_bytes:
+            self.data_size -= len(self.data.popitem(last=False)[1][1])
+
+        return data
+
+    def _not_modified(self, image: StoredImage) -> bool:
+        if request.if_none_match:
+            return request.if_none_match.contains(image.etag)
+
+        if (since := request.if_modified_since) is not None:
+            return int(image.mtime) <= since.timestamp()
+
+        return False
+
+    async def serve(self, id: int, size: Optional[str] = None) -> Response:
+        """Serve `id`'s image (at `size`, e.g. '64x64', if stored),
+        or our fallback image if they don't have one."""
+        try:
+            return await self._serve(id, size)
+        except FileNotFoundError:
+            # replaced (by an upload) between resolving & reading it.
+            self.invalidate(id)
+            return await self._serve(id, size)
+
+    async def _serve(self, id: int, size: Optional[str]) -> Response:
+        image = None
+        if size is not None:
+            image = self._resolve(f'{id}_{size}')
+        if image is None:
+            image = self._resolve(str(id)) or self.fallback
+
+        if self._not_modified(image):
+            resp = Response(b'', status=304)
+        elif image.size <= self.max_file:
+            resp = Response(await self._read(image), mimetype=image.mimetype)
+        elif self.accel_prefix is not None and image is not self.fallback:
+            # nginx sends the file itself; we only send headers.
+            resp = Response(b'', mimetype=image.mimetype)
+            resp.headers['X-Accel-Redirect'] = \
+                f'{self.accel_prefix}/{os.path.basename(image.path)}'
+        else:
+            resp = await send_file(image.path, mimetype=image.mimetype)
+
+        resp.set_etag(image.etag)
+        resp.last_modified = datetime.datetime.fromtimestamp(
+            image.mtime, tz=datetime.timezone.utc)
+        resp.headers['Cache-Control'] = self.cache_control
+        return resp
+
+    @property
+    def stats(self) -> dict[str, float]:
+        return {
+            'indexed': len(self.index),
+            'cached': len(self.data),
+            'cached_bytes': self.data_size,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('LEADERBOARD_PAGE_SIZE', 'fetch_leaderboard',
+           'fetch_leaderboard_total')
+
+from typing import Any
+from typing import Optional
+from typing import Union
+
+from cmyui.logging import Ansi
+from cmyui.logging import log
+
+from objects import glob
+
+LEADERBOARD_PAGE_SIZE = 50
+
+# stats columns stored as (single precision) floats. a cursor holds
+# the shortest repr of the value, which only compares exactly to the
+# column once cast back to a float (mysql 8.0.17+).
+FLOAT_COLUMNS = frozenset({'acc'})
+
+
+async def fetch_leaderboard(mode: int, sort_by: str,
+                            country: Optional[str] = None, page: int = 1,
+                            cursor: Optional[tuple[Union[int, float], int]] = None
+                            ) -> list[dict[str, Any]]:
+    """Fetch a page of a leaderboard, selected either by number, or
+    by the (sort value, user id) of the previous page's last row.
+
+    NOTE: `sort_by` is interpolated, and must already be validated."""
+    q = ['SELECT u.id user_id, u.name username, tscore,',
+         'rscore, pp, plays, playtime, acc, max_combo',
+         'FROM stats JOIN users u ON stats.id = u.id',
+         f'WHERE mode = %s AND u.priv >= 3 AND {sort_by} > 0']
+    args = [mode]
+
+    if country is not None:
+        q.append('AND country = %s')
+        args.append(country)
+
+    if cursor is not None:
+        # seek past the last row of the previous page, by the (value, id)
+        # it had then; so rows don't drift if its value has since changed.
+        seek = 'CAST(%s AS FLOAT)' if sort_by in FLOAT_COLUMNS else '%s'
+        q.append(f'AND ({sort_by} < {seek} OR ({sort_by} = {seek} AND u.id > %s))')
+        args.extend((cursor[0], cursor[0], cursor[1]))
+
+    q.append(f'ORDER BY {sort_by} DESC, u.id ASC')
+
+    if cursor is not None:
+        q.append(f'LIMIT {LEADERBOARD_PAGE_SIZE}')
+    else:
+        q.append(f'LIMIT {LEADERBOARD_PAGE_SIZE} '
+                 f'OFFSET {(page - 1) * LEADERBOARD_PAGE_SIZE}')
+
+    if glob.config.debug:  # log extra info if in debug mode
+        log(' '.join(q), Ansi.LMAGENTA)
+
+    return await glob.db.fetchall(' '.join(q), args)
+
+
+async def fetch_leaderboard_total(mode: int, sort_by: str,
+                                  country: Optional[str] = None) -> int:
+    """Return the number of players on a leaderboard;
+    this is cached, so it's only an estimate."""
+    async def count() -> int:
+        q = ['SELECT COUNT(*) AS total',
+             'FROM stats JOIN users u ON stats.id = u.id',
+             f'WHERE mode = %s AND u.priv >= 3 AND {sort_by} > 0']
+        args = [mode]
+
+        if country is not None:
+            q.append('AND country = %s')
+            args.append(country)
+
+        return (await glob.db.fetch(' '.join(q), args))['total']
+
+    return await glob.responses.get_or_set(
+        ('leaderboard_total', mode, sort_by, country), count,
+        ttl=glob.config.leaderboard_total_ttl,
+        cacheable=lambda total: total is not None)
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('Histogram', 'RequestStats', 'Metrics')
+
+import bisect
+import contextvars
+from collections import defaultdict
+from typing import Callable
+from typing import Optional
+
+from cmyui.logging import Ansi
+from cmyui.logging import log
+
+from objects import glob
+
+# seconds; roughly prometheus' defaults.
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05,
+                   .1, .25, .5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+
+class Histogram:
+    """A cumulative histogram, as exposed to prometheus."""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def expose(self, name: str, labels: str) -> list[str]:
+        lines = []
+        cumulative = 0
+        sep = ',' if labels else ''
+
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+
+        lines.append(f'{name}_sum{{{labels}}} {self.sum}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+
+class RequestStats:
+    """Database usage by a single request."""
+
+    __slots__ = ('queries', 'query_time', 'rows')
+
+    def __init__(self) -> None:
+        self.queries = 0
+        self.query_time = 0.0
+        self.rows = 0
+
+
+# the stats of the request currently being handled (if any);
+# tasks spawned by a request inherit (and share) its stats.
+current_request: contextvars.ContextVar[Optional[RequestStats]] = \
+    contextvars.ContextVar('current_request', default=None)
+
+
+class Metrics:
+    """Request & database metrics, exposed in prometheus' text format."""
+
+    def __init__(self) -> None:
+        # {(method, endpoint, status): histogram}
+        self.latency: dict[tuple[str, str, int], Histogram] = \
+            defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        # {endpoint: histogram}
+        self.request_queries: dict[str, Histogram] = \
+            defaultdict(lambda: Histogram(QUERY_COUNT_BUCKETS))
+        self.request_query_time: dict[str, Histogram] = \
+            defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+
+        self.query_time = Histogram(LATENCY_BUCKETS)
+        self.query_rows = 0
+        self.slow_queries = 0
+
+        # {pool: histogram}
+        self.acquire_time: dict[str, Histogram] = \
+            defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.acquire_timeouts: dict[str, int] = defaultdict(int)
+
+        # {name: callable returning {stat: value}}, sampled on scrape.
+        self.gauges: dict[str, Callable[[], dict[str, float]]] = {}
+
+    def observe_request(self, method: str, endpoint: str, status: int,
+                        elapsed: float, stats: RequestStats) -> None:
+        self.latency[(method, endpoint, status)].observe(elapsed)
+        self.request_queries[endpoint].observe(stats.queries)
+        self.request_query_time[endpoint].observe(stats.query_time)
+
+    def observe_query(self, query: str, elapsed: float, rows: int) -> None:
+        self.query_time.observe(elapsed)
+        self.query_rows += rows
+
+        if (stats := current_request.get()) is not None:
+            stats.queries += 1
+            stats.query_time += elapsed
+            stats.rows += rows
+
+        if elapsed * 1000 >= glob.config.slow_query_threshold:
+            self.slow_queries += 1
+            log(f'Slow query ({elapsed * 1000:.2f}ms): {query}', Ansi.LYELLOW)
+
+    def observe_acquire(self, pool: str, elapsed: float,
+                        timed_out: bool = False) -> None:
+        self.acquire_time[pool].observe(elapsed)
+        if timed_out:
+            self.acquire_timeouts[pool] += 1
+
+    def expose(self) -> str:
+        lines = ['# TYPE http_request_duration_seconds histogram']
+        for (method, endpoint, status), hist in self.latency.items():
+            labels = f'method="{method}",endpoint="{endpoint}",status="{status}"'
+            lines += hist.expose('http_request_duration_seconds', labels)
+
+        lines.append('# TYPE http_request_db_queries histogram')
+        for endpoint, hist in self.request_queries.items():
+            lines += hist.expose('http_request_db_queries', f'endpoint="{endpoint}"')
+
+        lines.append('# TYPE http_request_db_seconds histogram')
+        for endpoint, hist in self.request_query_time.items():
+            lines += hist.expose('http_request_db_seconds', f'endpoint="{endpoint}"')
+
+        lines.append('# TYPE db_query_duration_seconds histogram')
+        lines += self.query_time.expose('db_query_duration_seconds', '')
+
+        lines.append('# TYPE db_rows_returned_total counter')
+        lines.append(f'db_rows_returned_total {self.query_rows}')
+        lines.append('# TYPE db_slow_queries_total counter')
+        lines.append(f'db_slow_queries_total {self.slow_queries}')
+
+        lines.append('# TYPE db_pool_acquire_seconds histogram')
+        for pool, hist in self.acquire_time.items():
+            lines += hist.expose('db_pool_acquire_seconds', f'pool="{pool}"')
+
+        lines.append('# TYPE db_pool_acquire_timeouts_total counter')
+        for pool, count in self.acquire_timeouts.items():
+            lines.append(f'db_pool_acquire_timeouts_total{{pool="{pool}"}} {count}')
+
+        for name, sample in self.gauges.items():
+            for stat, value in sample().items():
+                lines.append(f'{name}_{stat} {value}')
+
+        return '\n'.join(lines) + '\n'
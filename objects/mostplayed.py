@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('MostPlayed',)
+
+import heapq
+from collections import Counter
+from collections import OrderedDict
+from typing import Optional
+
+from cmyui.logging import Ansi
+from cmyui.logging import log
+
+from objects import glob
+
+
+class MostPlayed:
+    """Per-(user, mode, mods) play counts for each map.
+
+    Like `GradeCache`, each entry remembers the score id watermark
+    it was counted to, and catches up by counting only newer scores;
+    a player's most played maps are then a top-k over their counts,
+    rather than a GROUP BY & filesort over their whole history.
+
+    Heavy players have thousands of maps each, so the cache is bounded
+    by the total number of (map, count)s it holds, not by players."""
+
+    __slots__ = ('entries', 'max_maps', 'size')
+
+    def __init__(self, max_maps: int) -> None:
+        self.max_maps = max_maps
+        # {(id, mode, mods): (watermark, {map_md5: plays})}
+        self.entries: OrderedDict[tuple[int, int, str],
+                                  tuple[int, Counter]] = OrderedDict()
+        # the number of maps counted across all entries.
+        self.size = 0
+
+    @staticmethod
+    async def count_plays(id: int, mode: int, mods: str, after_id: int = 0,
+                          until_id: Optional[int] = None) -> Counter:
+        """Count a player's plays of each map in the database."""
+        q = [f'SELECT map_md5, COUNT(*) AS count FROM scores_{mods}',
+             f'JOIN maps ON scores_{mods}.map_md5 = maps.md5',
+             f'WHERE userid = %s AND scores_{mods}.mode = %s',
+             f'AND scores_{mods}.id > %s']
+        args = [id, mode, after_id]
+
+        if until_id is not None:
+            q.append(f'AND scores_{mods}.id <= %s')
+            args.append(until_id)
+
+        q.append('GROUP BY map_md5')
+        q = ' '.join(q)
+
+        if glob.config.debug:
+            log(q, Ansi.LMAGENTA)
+
+        return Counter({row['map_md5']: row['count']
+                        for row in await glob.db.fetchall(q, args)})
+
+    def _store(self, key: tuple[int, int, str], watermark: int,
+               plays: Counter) -> None:
+        if (old := self.entries.pop(key, None)) is not None:
+            self.size -= len(old[1])
+
+        if len(plays) > self.max_maps:
+            return  # would evict everyone else; just recount it
+
+        self.entries[key] = (watermark, plays)
+        self.size += len(plays)
+
+        while self.size > self.max_maps:
+            self.size -= len(self.entries.popitem(last=False)[1][1])
+
+    async def get_plays(self, id: int, mode: int, mods: str) -> Counter:
+        key = (id, mode, mods)
+        watermark = glob.watermarks.get(mods)
+
+        if not watermark:
+            # we don't know where the scores table is at yet.
+            return await self.count_plays(id, mode, mods)
+
+        if (entry := self.entries.get(key)) is not None:
+            counted_at, plays = entry
+
+            if counted_at < watermark:
+                # count only the scores submitted since.
+                plays = plays + await self.count_plays(
+                    id, mode, mods, counted_at, watermark)
+        else:
+            plays = await self.count_plays(id, mode, mods,
+                                           until_id=watermark)
+
+        self._store(key, watermark, plays)
+        return plays
+
+    async def top(self, id: int, mode: int, mods: str,
+                  limit: int) -> list[tuple[str, int]]:
+        """Return a player's `limit` most played maps & their play counts."""
+        plays = await self.get_plays(id, mode, mods)
+        return heapq.nlargest(limit, plays.items(), key=lambda p: p[1])
+
+    async def rebuild(self, users: int) -> None:
+        """Drop every entry, and backfill the `users` most recently
+        active players' counts for all modes, in one pass per table."""
+        self.entries.clear()
+        self.size = 0
+
+        recent = await glob.db.fetchall(
+            'SELECT id FROM users WHERE priv >= 3 '
+            'ORDER BY latest_activity DESC LIMIT %s', [users]
+        )
+        if not recent:
+            return
+
+        ids = [row['id'] for row in recent]
+        placeholders = ', '.join(['%s'] * len(ids))
+
+        for mods in ('vn', 'rx', 'ap'):
+            watermark = glob.watermarks.get(mods)
+
+            res = await glob.db.fetchall(
+                f'SELECT userid, scores_{mods}.mode, map_md5, COUNT(*) AS count '
+                f'FROM scores_{mods} JOIN maps ON scores_{mods}.map_md5 = maps.md5 '
+                f'WHERE userid IN ({placeholders}) AND scores_{mods}.id <= %s '
+                f'GROUP BY userid, scores_{mods}.mode, map_md5',
+                ids + [watermark]
+            )
+
+            counts: dict[tuple[int, int, str], Counter] = {}
+            for row in res:
+                key = (row['userid'], row['mode'], mods)
+                counts.setdefault(key, Counter())[row['map_md5']] = row['count']
+
+            for key, plays in counts.items():
+                self._store(key, watermark, plays)
+
+        log(f'Backfilled most played maps for {len(ids)} players.', Ansi.LMAGENTA)
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('StaticPages', 'render_page')
+
+from typing import Iterable
+from typing import Optional
+
+from cmyui.logging import Ansi
+from cmyui.logging import log
+from jinja2 import TemplateError
+from quart import Quart
+from quart import Response
+from quart import render_template
+from quart import session
+
+from objects import glob
+
+
+class StaticPages:
+    """Pages which only vary by whether the visitor is logged in.
+
+    They're rendered once at startup, as an anonymous visitor would
+    see them, and those bytes are served to anonymous visitors
+    without running jinja at all."""
+
+    __slots__ = ('pages', 'version')
+
+    def __init__(self, version: str = '') -> None:
+        # {template name: rendered html}
+        self.pages: dict[str, bytes] = {}
+        # identifies the templates & assets pages are rendered
+        # from; any page validator (etag) should include it.
+        self.version = version
+
+    async def render(self, app: Quart, names: Iterable[str]) -> None:
+        for name in names:
+            # an empty request, so an empty session.
+            async with app.test_request_context('/'):
+                try:
+                    self.pages[name] = (await render_template(name)).encode()
+                except TemplateError as exc:
+                    log(f'Failed to pre-render {name}: {exc}', Ansi.LRED)
+
+    def get(self, name: str) -> Optional[bytes]:
+        if 'authenticated' in session:
+            return None  # the navbar (at least) is personalized
+
+        return self.pages.get(name)
+
+
+async def render_page(name: str, status: int = 200) -> Response:
+    """Serve `name` pre-rendered if we can, or render it otherwise."""
+    if (page := glob.pages.get(name)) is not None:
+        return Response(page, status=status, mimetype='text/html')
+
+    return Response(await render_template(name), status=status,
+                    mimetype='text/html')
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('PlayerIndex',)
+
+import asyncio
+import bisect
+import heapq
+import itertools
+from typing import Any
+
+from cmyui.logging import Ansi
+from cmyui.logging import log
+
+from objects import glob
+from objects.utils import get_safe_name
+
+# substring matches are found through trigrams,
+# so shorter queries only match by prefix.
+TRIGRAM = 3
+
+
+def _trigrams(safe_name: str) -> set[str]:
+    return {safe_name[i:i + TRIGRAM]
+            for i in range(len(safe_name) - TRIGRAM + 1)}
+
+
+class PlayerIndex:
+    """An in-memory index of player names, for search.
+
+    Names are kept in a sorted array (so a prefix is a range found
+    by binary search), and a trigram index (so substrings are found
+    by intersecting a few small sets). New players are picked up
+    by id; renames are applied directly by the worker serving them,
+    and picked up by the rest (or if made in-game) by a periodic
+    full re-read.
+
+    Who's searchable, and their pp, comes from the rank index, so
+    a restricted player drops out of results as they leave it."""
+
+    __slots__ = ('names', 'ids', 'users', 'trigrams', 'max_id')
+
+    def __init__(self) -> None:
+        # sorted safe names, and the id at each position.
+        self.names: list[str] = []
+        self.ids: list[int] = []
+        # {user_id: (name, safe_name, country)}
+        self.users: dict[int, tuple[str, str, str]] = {}
+        # {trigram: {user_id, ...}}
+        self.trigrams: dict[str, set[int]] = {}
+        self.max_id = 0
+
+    def _index(self, user_id: int, name: str, country: str) -> str:
+        safe_name = get_safe_name(name)
+        self.users[user_id] = (name, safe_name, country)
+
+        for trigram in _trigrams(safe_name):
+            if trigram not in self.trigrams:
+                self.trigrams[trigram] = set()
+            self.trigrams[trigram].add(user_id)
+
+        self.max_id = max(self.max_id, user_id)
+        return safe_name
+
+    def add(self, user_id: int, name: str, country: str) -> None:
+        if user_id in self.users:
+            self.remove(user_id)
+
+        safe_name = self._index(user_id, name, country)
+        idx = bisect.bisect_left(self.names, safe_name)
+        self.names.insert(idx, safe_name)
+        self.ids.insert(idx, user_id)
+
+    def remove(self, user_id: int) -> None:
+        if (entry := self.users.pop(user_id, None)) is None:
+            return
+
+        safe_name = entry[1]
+        idx = bisect.bisect_left(self.names, safe_name)
+        while self.ids[idx] != user_id:  # names may (briefly) collide
+            idx += 1
+        del self.names[idx]
+        del self.ids[idx]
+
+        for trigram in _trigrams(safe_name):
+            ids = self.trigrams[trigram]
+            ids.discard(user_id)
+            if not ids:
+                del self.trigrams[trigram]
+
+    def rename(self, user_id: int, name: str) -> None:
+        if (entry := self.users.get(user_id)) is not None:
+            self.add(user_id, name, entry[2])
+
+    def search(self, query: str, mode: int, limit: int) -> list[dict[str, Any]]:
+        """Return up to `limit` players whose names contain `query`;
+        exact matches first, then prefix matches, each by pp."""
+        if not (query := get_safe_name(query)):
+            return []
+
+        # prefix matches; a contiguous range of the sorted names.
+        lo = bisect.bisect_left(self.names, query)
+        hi = bisect.bisect_left(self.names, query + '\uffff')
+        matches = set(self.ids[lo:hi])
+
+        # substring matches; players with every trigram of the query.
+        if len(query) >= TRIGRAM:
+            sets = sorted((self.trigrams.get(t, set()) for t in _trigrams(query)),
+                          key=len)
+            candidates = sets[0].intersection(*sets[1:])
+            matches.update(id for id in candidates
+                           if query in self.users[id][1])
+
+        players = glob.ranks.players
+        scored = []
+        for user_id in matches:
+            if (entry := players.get((mode, user_id))) is None:
+                continue  # restricted (or not yet indexed)
+
+            safe_name = self.users[user_id][1]
+            scored.append((safe_name == query, safe_name.startswith(query),
+                           entry[0], user_id))
+
+        return [
+            {
+                'id': user_id,
+                'name': self.users[user_id][0],
+                'country': self.users[user_id][2],
+                'pp': pp,
+                'rank': glob.ranks.get_rank(mode, user_id)
+            }
+            for _, _, pp, user_id in heapq.nlargest(limit, scored)
+        ]
+
+    async def refresh(self, full: bool = False) -> None:
+        """Index any players registered since the last refresh,
+        or re-read every player (and so any renames) if `full`."""
+        res = await glob.db.fetchall(
+            'SELECT id, name, country FROM users '
+            'WHERE id > %s ORDER BY id',
+            [0 if full else self.max_id]
+        )
+
+        if full:
+            self.users.clear()
+            self.trigrams.clear()
+            self.max_id = 0
+            entries = []
+        elif res:
+            entries = list(zip(self.names, self.ids))
+        else:
+            return
+
+        # one sort, rather than an insert per player (it's
+        # timsort, so merging in a few new names is ~linear).
+        for row in res:
+            entries.append((self._index(row['id'], row['name'], row['country']),
+                            row['id']))
+
+        entries.sort()
+        self.names = [safe_name for safe_name, _ in entries]
+        self.ids = [user_id for _, user_id in entries]
+
+    async def run(self, interval: int, full_interval: int) -> None:
+        """Refresh the index every `interval` seconds,
+        re-reading every player every `full_interval`."""
+        rounds = max(1, full_interval // interval)
+
+        for n in itertools.count(1):
+            await asyncio.sleep(interval)
+
+            try:
+                await self.refresh(full=n % rounds == 0)
+            except Exception as exc:
+                log(f'Failed to refresh player index: {exc}', Ansi.LRED)
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('serve', 'broadcast')
+
+import asyncio
+import os
+import signal
+import socket
+import time
+import traceback
+
+from cmyui.logging import Ansi
+from cmyui.logging import log
+from hypercorn.asyncio import serve as hypercorn_serve
+from hypercorn.config import Config
+from quart import Quart
+
+# set (before forking) when serving from workers; their parent.
+master_pid = None
+
+# signals the parent passes on to every worker (see `broadcast`).
+FORWARDED = (signal.SIGUSR1,)
+
+
+def broadcast(signum: int) -> bool:
+    """Deliver `signum` to every worker, returning whether it could;
+    if we aren't serving from our own workers (e.g. under hypercorn's
+    `--workers`, whose processes we don't know of), only this process
+    gets it."""
+    os.kill(master_pid or os.getpid(), signum)
+    return master_pid is not None
+
+
+async def _worker(app: Quart, config: Config) -> None:
+    shutdown = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, shutdown.set)
+
+    # the app's before_serving hooks (connecting to mysql,
+    # building indexes, warming up..) run here, per worker.
+    await hypercorn_serve(app, config, shutdown_trigger=shutdown.wait)
+
+
+def _spawn(app: Quart, config: Config) -> int:
+    if pid := os.fork():
+        return pid
+
+    # in the worker; the parent forwards shutdown to us as
+    # SIGTERM, so ignore the ctrl+c sent to the whole group.
+    # forwarded signals are ignored until the app handles them.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    for signum in FORWARDED:
+        signal.signal(signum, signal.SIG_IGN)
+
+    status = 0
+    try:
+        asyncio.run(_worker(app, config))
+    except BaseException:
+        traceback.print_exc()
+        status = 1
+    finally:
+        os._exit(status)
+
+
+def serve(app: Quart, bind: str, workers: int) -> None:
+    """Serve `app` from `workers` processes forked from this one.
+
+    Forking (rather than having each worker import the app) means
+    anything created at import, such as a shared memory cache, is
+    shared by the workers. They accept from one listening socket,
+    and any which die are replaced until we're told to stop."""
+    host, port = bind.rsplit(':', 1)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, int(port)))
+    sock.set_inheritable(True)
+
+    config = Config()
+    config.bind = [f'fd://{sock.fileno()}']
+    sock.listen(config.backlog)
+
+    global master_pid
+    master_pid = os.getpid()
+
+    pids = set()
+    stopping = False
+
+    def stop(signum: int, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass  # already exited; we'll reap it below
+
+    def forward(signum: int, frame) -> None:
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for signum in FORWARDED:
+        signal.signal(signum, forward)
+
+    for _ in range(workers):
+        pids.add(_spawn(app, config))
+    log(f'Serving on {bind} with {workers} workers.', Ansi.LMAGENTA)
+
+    while pids:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+
+        pids.discard(pid)
+        if stopping:
+            continue
+
+        log(f'Worker {pid} exited ({status}); replacing it.', Ansi.LRED)
+        time.sleep(1)  # don't spin if workers die on startup
+
+        if not stopping:
+            pids.add(_spawn(app, config))
+
+    sock.close()
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('RankHistory',)
+
+import array
+import asyncio
+import bisect
+import datetime
+import fcntl
+import os
+import struct
+import time
+from typing import Any
+from typing import BinaryIO
+from typing import Optional
+
+from cmyui.logging import Ansi
+from cmyui.logging import log
+
+from objects import glob
+from objects.utils import atomic_write
+
+# each (mode, mods) has its own file, `{mode}.bin`, laid out as:
+#   header: magic, version, last day recorded, number of players
+#   index:  player ids, slice offsets & slice lengths (3 columns)
+#   slices: per player, in id order
+# where a slice is its first day & number of days, then its global
+# and country ranks as two delta-encoded (zigzag varint) columns.
+# days are counted from the unix epoch (utc); a rank of 0 means the
+# player wasn't ranked that day.
+MAGIC = b'GWRH'
+VERSION = 1
+HEADER = struct.Struct('<4sHII')
+SLICE_HEADER = struct.Struct('<IH')
+
+# the index's columns are arrays of u32.
+INDEX_ITEM = array.array('I').itemsize
+
+SECONDS_PER_DAY = 60 * 60 * 24
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+Series = tuple[int, list[int], list[int]]  # (first day, global, country)
+
+
+def _today() -> int:
+    return int(time.time() // SECONDS_PER_DAY)
+
+
+def _encode_column(values: list[int]) -> bytes:
+    out = bytearray()
+    prev = 0
+
+    for value in values:
+        delta = value - prev
+        prev = value
+
+        n = delta << 1 if delta >= 0 else (-delta << 1) - 1
+        while n >= 0x80:
+            out.append((n & 0x7f) | 0x80)
+            n >>= 7
+        out.append(n)
+
+    return bytes(out)
+
+
+def _decode_column(data: bytes, pos: int, count: int) -> tuple[list[int], int]:
+    values = []
+    prev = 0
+
+    for _ in range(count):
+        n = shift = 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            n |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+
+        prev += n >> 1 if not n & 1 else -((n + 1) >> 1)
+        values.append(prev)
+
+    return values, pos
+
+
+def _encode_slice(series: Series) -> bytes:
+    first_day, global_ranks, country_ranks = series
+    return (SLICE_HEADER.pack(first_day, len(global_ranks)) +
+            _encode_column(global_ranks) + _encode_column(country_ranks))
+
+
+def _decode_slice(data: bytes) -> Series:
+    first_day, count = SLICE_HEADER.unpack_from(data)
+    global_ranks, pos = _decode_column(data, SLICE_HEADER.size, count)
+    country_ranks, _ = _decode_column(data, pos, count)
+    return first_day, global_ranks, country_ranks
+
+
+def _column(data: bytes, count: int, pos: int) -> tuple[array.array, int]:
+    column = array.array('I')
+    column.frombytes(data[pos:pos + count * INDEX_ITEM])
+    return column, pos + count * INDEX_ITEM
+
+
+def _read_index(f: BinaryIO) -> tuple[int, array.array, array.array, array.array]:
+    magic, version, last_day, count = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('not a rank history file')
+
+    data = f.read(count * INDEX_ITEM * 3)
+    ids, pos = _column(data, count, 0)
+    offsets, pos = _column(data, count, pos)
+    lengths, _ = _column(data, count, pos)
+    return last_day, ids, offsets, lengths
+
+
+def _read_all(path: str) -> tuple[int, dict[int, Series]]:
+    try:
+        with open(path, 'rb') as f:
+            last_day, ids, offsets, lengths = _read_index(f)
+            data = f.read()
+    except FileNotFoundError:
+        return 0, {}
+
+    base = HEADER.size + len(ids) * INDEX_ITEM * 3
+    return last_day, {
+        user_id: _decode_slice(data[offset - base:offset - base + length])
+        for user_id, offset, length in zip(ids, offsets, lengths)
+    }
+
+
+def _write_all(path: str, last_day: int, players: dict[int, Series]) -> None:
+    ids = array.array('I', sorted(players))
+    slices = [_encode_slice(players[user_id]) for user_id in ids]
+
+    offsets = array.array('I')
+    lengths = array.array('I')
+    offset = HEADER.size + len(ids) * INDEX_ITEM * 3
+    for data in slices:
+        offsets.append(offset)
+        lengths.append(len(data))
+        offset += len(data)
+
+    # swap files in place, so readers never see a partial file.
+    atomic_write(path, b''.join([
+        HEADER.pack(MAGIC, VERSION, last_day, len(ids)),
+        ids.tobytes(), offsets.tobytes(), lengths.tobytes(), *slices
+    ]))
+
+
+class ModeHistory:
+    """An open history file, and its index (kept in memory)."""
+
+    __slots__ = ('fd', 'last_day', 'ids', 'offsets', 'lengths')
+
+    def __init__(self, path: str) -> None:
+        # held open, so reads stay consistent with the
+        # index even once the file's been replaced.
+        self.fd = os.open(path, os.O_RDONLY)
+
+        with open(self.fd, 'rb', closefd=False) as f:
+            self.last_day, self.ids, self.offsets, self.lengths = _read_index(f)
+
+    def locate(self, user_id: int) -> Optional[tuple[int, int]]:
+        idx = bisect.bisect_left(self.ids, user_id)
+        if idx == len(self.ids) or self.ids[idx] != user_id:
+            return None
+
+        return self.offsets[idx], self.lengths[idx]
+
+    def __del__(self) -> None:
+        # only once nothing (e.g. a read in flight) holds this history;
+        # if closed any sooner, a read could land on a reused fd.
+        if (fd := getattr(self, 'fd', None)) is not None:
+            os.close(fd)
+
+
+class RankHistory:
+    """Daily snapshots of every ranked player's global & country rank.
+
+    Snapshots are taken (from the rank index) once a day, by whichever
+    worker gets there first; the files are only ever read a player's
+    slice at a time, so a 90 day graph costs one small read."""
+
+    def __init__(self, directory: str, retention: int) -> None:
+        self.directory = directory
+        self.retention = retention
+
+        # {mode: history}
+        self.modes: dict[int, ModeHistory] = {}
+
+    @property
+    def last_day(self) -> int:
+        return max((h.last_day for h in self.modes.values()), default=0)
+
+    def load(self) -> None:
+        """(Re)open every mode's file, and read its index.
+
+        The files open before aren't closed here, as a fetch may still
+        be reading one; each is closed once it's no longer referenced."""
+        modes = {}
+
+        for name in os.listdir(self.directory):
+            if not name.endswith('.bin'):
+                continue
+
+            try:
+                modes[int(name[:-4])] = ModeHistory(
+                    os.path.join(self.directory, name))
+            except (ValueError, struct.error) as exc:
+                log(f'Failed to load rank history {name}: {exc}', Ansi.LRED)
+
+        self.modes = modes
+
+    def _collect(self) -> dict[int, dict[int, tuple[int, int]]]:
+        # {mode: {user_id: (global rank, country rank)}}
+        ranks = {}
+
+        for (mode, user_id), (pp, country) in glob.ranks.players.items():
+            if pp <= 0:
+                continue  # not active in this mode
+
+            if mode not in ranks:
+                ranks[mode] = {}
+
+            ranks[mode][user_id] = (glob.ranks.get_rank(mode, user_id),
+                                    glob.ranks.get_rank(mode, user_id, country))
+
+        return ranks
+
+    def _record(self, today: int, ranks: dict[int, dict[int, tuple[int, int]]]) -> int:
+        # one writer at a time (across workers); the others
+        # wait, then find today's snapshot already taken.
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            recorded = 0
+            for mode, current in ranks.items():
+                path = os.path.join(self.directory, f'{mode}.bin')
+                last_day, players = _read_all(path)
+
+                if last_day >= today:
+                    continue  # already recorded today
+
+                gap = [0] * (today - last_day - 1) if last_day else []
+                oldest = today - self.retention + 1
+
+                series = {}
+                for user_id in players.keys() | current.keys():
+                    global_rank, country_rank = current.get(user_id, (0, 0))
+
+                    if user_id in players:
+                        first_day, global_ranks, country_ranks = players[user_id]
+                        global_ranks += gap + [global_rank]
+                        country_ranks += gap + [country_rank]
+                    else:
+                        first_day = today
+                        global_ranks = [global_rank]
+                        country_ranks = [country_rank]
+
+                    # drop the days which have aged out, and
+                    # any leading days the player wasn't ranked.
+                    skip = max(0, oldest - first_day)
+                    while skip < len(global_ranks) and not global_ranks[skip]:
+                        skip += 1
+
+                    if skip < len(global_ranks):
+                        series[user_id] = (first_day + skip,
+                                           global_ranks[skip:],
+                                           country_ranks[skip:])
+
+                _write_all(path, today, series)
+                recorded += 1
+
+            return recorded
+
+    async def snapshot(self) -> None:
+        """Record today's ranks, unless they've been recorded already."""
+        start = time.perf_counter()
+
+        os.makedirs(self.directory, exist_ok=True)
+        recorded = await asyncio.to_thread(self._record, _today(), self._collect())
+        self.load()
+
+        if recorded:
+            elapsed = (time.perf_counter() - start) * 1000
+            log(f'Recorded rank history for {recorded} modes in {elapsed:.2f}ms.',
+                Ansi.LMAGENTA)
+
+    async def run(self) -> None:
+        """Take a snapshot shortly after each midnight (utc)."""
+        while True:
+            await asyncio.sleep(SECONDS_PER_DAY - time.time() % SECONDS_PER_DAY + 60)
+
+            try:
+                await self.snapshot()
+            except Exception as exc:
+                log(f'Failed to record rank history: {exc}', Ansi.LRED)
+
+    async def fetch(self, mode: int, user_id: int,
+                    days: int) -> list[dict[str, Any]]:
+        """Return a player's ranks over (up to) the last `days` days."""
+        if (
+            (history := self.modes.get(mode)) is None or
+            (location := history.locate(user_id)) is None
+        ):
+            return []
+
+        offset, length = location
+        data = await asyncio.to_thread(os.pread, history.fd, length, offset)
+        first_day, global_ranks, country_ranks = _decode_slice(data)
+
+        skip = max(0, len(global_ranks) - days)
+        return [
+            {
+                'date': datetime.date.fromordinal(EPOCH_ORDINAL + day).isoformat(),
+                'global': global_rank,
+                'country': country_rank
+            }
+            for day, global_rank, country_rank in zip(
+                range(first_day + skip, first_day + len(global_ranks)),
+                global_ranks[skip:], country_ranks[skip:])
+            if global_rank  # unranked that day
+        ]
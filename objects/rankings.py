@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('RankIndex',)
+
+import asyncio
+import bisect
+from typing import Optional
+
+from cmyui.logging import Ansi
+from cmyui.logging import log
+
+from objects import glob
+
+# rebuild (rather than update) the index once more
+# than 1/REBUILD_FRACTION of its entries have changed.
+REBUILD_FRACTION = 8
+
+
+class RankIndex:
+    """An in-memory, per-mode and per-country index of player pp.
+
+    Each board is kept as an ascending list of pp values, so a
+    player's rank is a single binary search (O(log n)) rather than
+    a walk over every row of `stats`."""
+
+    __slots__ = ('boards', 'players', 'warm')
+
+    def __init__(self) -> None:
+        # {(mode, country | None): [pp, ...] (ascending)}
+        self.boards: dict[tuple[int, Optional[str]], list[float]] = {}
+        # {(mode, user_id): (pp, country)}
+        self.players: dict[tuple[int, int], tuple[float, str]] = {}
+        self.warm = False
+
+    def _board(self, mode: int, country: Optional[str]) -> list[float]:
+        if (key := (mode, country)) not in self.boards:
+            self.boards[key] = []
+        return self.boards[key]
+
+    def _insert(self, mode: int, pp: float, country: str) -> None:
+        bisect.insort(self._board(mode, None), pp)
+        bisect.insort(self._board(mode, country), pp)
+
+    def _remove(self, mode: int, pp: float, country: str) -> None:
+        for board in (self.boards[(mode, None)], self.boards[(mode, country)]):
+            del board[bisect.bisect_left(board, pp)]
+
+    def update(self, mode: int, user_id: int, pp: float,
+               country: str) -> None:
+        """Apply a single player's (new) pp to the index."""
+        key = (mode, user_id)
+
+        if key in self.players:
+            old_pp, old_country = self.players[key]
+            if old_pp == pp and old_country == country:
+                return  # nothing changed
+            self._remove(mode, old_pp, old_country)
+
+        self.players[key] = (pp, country)
+        self._insert(mode, pp, country)
+
+    def remove(self, mode: int, user_id: int) -> None:
+        """Remove a player (e.g. restricted) from the index."""
+        if (entry := self.players.pop((mode, user_id), None)):
+            self._remove(mode, *entry)
+
+    def get_rank(self, mode: int, user_id: int,
+                 country: Optional[str] = None) -> Optional[int]:
+        """Return a player's rank, or `None` if they aren't indexed."""
+        if (entry := self.players.get((mode, user_id))) is None:
+            return None
+
+        pp, player_country = entry
+        if country is not None and country != player_country:
+            return None
+
+        board = self.boards[(mode, country)]
+        # rank is the number of players with more pp, plus one.
+        return len(board) - bisect.bisect_right(board, pp) + 1
+
+    def _build(self, players: dict[tuple[int, int], tuple[float, str]]) -> None:
+        """Replace the whole index, sorting each board once."""
+        boards: dict[tuple[int, Optional[str]], list[float]] = {}
+
+        for (mode, _), (pp, country) in players.items():
+            for key in ((mode, None), (mode, country)):
+                if key not in boards:
+                    boards[key] = []
+                boards[key].append(pp)
+
+        for board in boards.values():
+            board.sort()
+
+        self.boards = boards
+        self.players = players
+
+    async def refresh(self) -> None:
+        """Sync the index with the `stats` table, applying only
+        the rows which have changed since the last refresh (or
+        rebuilding it, if most of them have)."""
+        res = await glob.db.fetchall(
+            'SELECT s.id user_id, s.mode, s.pp, u.country '
+            'FROM stats s JOIN users u ON s.id = u.id '
+            'WHERE u.priv >= 3'
+        )
+
+        players = {(row['mode'], row['user_id']): (row['pp'], row['country'])
+                   for row in res}
+
+        changed = [key for key, entry in players.items()
+                   if self.players.get(key) != entry]
+        removed = self.players.keys() - players.keys()
+
+        # each update is O(n) (a list insert), so past a point,
+        # sorting everything afresh is cheaper; e.g. at startup.
+        if len(changed) + len(removed) > len(players) // REBUILD_FRACTION:
+            self._build(players)
+        else:
+            for key in changed:
+                self.update(*key, *players[key])
+
+            for key in removed:
+                self.remove(*key)
+
+        self.warm = True
+
+    async def run(self, interval: int) -> None:
+        """Refresh the index every `interval` seconds."""
+        while True:
+            await asyncio.sleep(interval)
+
+            try:
+                await self.refresh()
+            except Exception as exc:
+                log(f'Failed to refresh rank index: {exc}', Ansi.LRED)
+
+    async def fetch_rank(self, mode: int, user_id: int,
+                         country: Optional[str] = None) -> int:
+        """Return a player's rank (0 if they've no stats in `mode`);
+        falls back to the database if the index is still cold."""
+        if self.warm:
+            if (rank := self.get_rank(mode, user_id, country)) is not None:
+                return rank
+
+        q = [
+            'SELECT (SELECT COUNT(*) FROM stats s',
+            'JOIN users u ON s.id = u.id',
+            'WHERE s.mode = %s AND u.priv >= 3 AND s.pp > t.pp'
+        ]
+        args = [mode]
+
+        if country is not None:
+            q.append('AND u.country = %s')
+            args.append(country)
+
+        q.append(') AS higher FROM stats t WHERE t.id = %s AND t.mode = %s')
+        args.extend((user_id, mode))
+
+        if (res := await glob.db.fetch(' '.join(q), args)) is None:
+            return 0  # not ranked
+
+        return res['higher'] + 1
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('dumps', 'json_response', 'stream_json', 'StreamedResponse')
+
+import decimal
+from typing import Any
+from typing import AsyncIterator
+from typing import Callable
+
+import orjson
+from cmyui.logging import Ansi
+from cmyui.logging import log
+from quart import Response
+
+# streamed responses are sent in chunks of about this size.
+CHUNK_SIZE = 64 * 1024
+
+# results of up to this many rows are sent whole, rather than streamed.
+STREAM_THRESHOLD = 500
+
+
+def _default(obj: Any) -> Any:
+    # orjson handles datetimes natively, but not decimals.
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, (bytes, bytearray)):
+        return obj.decode()
+    raise TypeError
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize `obj` (e.g. database rows, as-is) to json."""
+    return orjson.dumps(obj, default=_default,
+                        option=orjson.OPT_NON_STR_KEYS)
+
+
+def json_response(*args: Any, status: int = 200, **kwargs: Any) -> Response:
+    """Like `quart.jsonify`, but serialized with orjson."""
+    if args and kwargs:
+        raise TypeError('json_response takes either args or kwargs, not both')
+
+    if kwargs:
+        obj = kwargs
+    elif len(args) == 1:
+        obj = args[0]
+    else:
+        obj = list(args)
+
+    return Response(dumps(obj), status=status, mimetype='application/json')
+
+
+class StreamedResponse(Response):
+    """A response whose body is produced as it's sent.
+
+    Callbacks given to `call_on_close` run once the body has been sent
+    (or abandoned), as the work producing it happens after the route
+    (& any `after_request` hooks) have returned."""
+
+    def __init__(self, body: AsyncIterator[bytes], **kwargs: Any) -> None:
+        self.on_close: list[Callable[[], None]] = []
+        super().__init__(self._send(body), **kwargs)
+
+    async def _send(self, body: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            for callback in self.on_close:
+                callback()
+
+    def call_on_close(self, callback: Callable[[], None]) -> None:
+        self.on_close.append(callback)
+
+
+async def stream_json(key: str, rows: AsyncIterator[Any],
+                      **fields: Any) -> Response:
+    """Respond with a json object of `fields`, and the array of `rows`
+    under `key`. Large arrays are streamed, encoded in chunks as they
+    arrive, so memory use doesn't grow with the size of the result.
+
+    Once streaming, the status has already been sent, so a failure
+    part way closes the object with an `error` rather than leaving
+    it truncated; streamed responses are also never stored by caches."""
+    rows = rows.__aiter__()
+
+    # most results are small; those are sent whole, as usual.
+    head = []
+    async for row in rows:
+        head.append(row)
+        if len(head) > STREAM_THRESHOLD:
+            break
+    else:
+        return json_response({**fields, key: head})
+
+    async def body() -> AsyncIterator[bytes]:
+        buf = bytearray(dumps(fields)[:-1])  # strip the closing brace
+        if fields:
+            buf += b','
+        buf += dumps(key) + b':['
+        buf += b','.join(dumps(row) for row in head)
+
+        try:
+            async for row in rows:
+                buf += b','
+                buf += dumps(row)
+
+                if len(buf) >= CHUNK_SIZE:
+                    yield bytes(buf)
+                    buf.clear()
+        except Exception as exc:
+            log(f'Failed to stream {key}: {exc}', Ansi.LRED)
+            buf += b'],"error":' + dumps('the response was cut short') + b'}'
+        else:
+            buf += b']}'
+
+        yield bytes(buf)
+
+    resp = StreamedResponse(body(), mimetype='application/json')
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
@@ -1,10 +1,15 @@
 # -*- coding: utf-8 -*-
 
+import hmac
+import os
+import secrets
+import tempfile
 from typing import Optional
 
 from cmyui.logging import Ansi
 from cmyui.logging import log
 from quart import render_template
+from quart import session
 
 from objects import glob
 
@@ -32,6 +37,33 @@ def mode_mods_to_int(mode: str) -> int:
         return 0
 
 
+def csrf_token() -> str:
+    """Return the session's csrf token, for forms which change state."""
+    if 'csrf_token' not in session:
+        session['csrf_token'] = secrets.token_urlsafe(32)
+    return session['csrf_token']
+
+
+def valid_csrf(token: Optional[str]) -> bool:
+    """Whether `token` (from a submitted form) is the session's."""
+    return (token is not None and 'csrf_token' in session and
+            hmac.compare_digest(token, session['csrf_token']))
+
+
+def atomic_write(path: str, data: bytes, mode: int = 0o644) -> None:
+    """Write `data` to `path` (with permissions `mode`) by swapping
+    in a temporary file, so readers never see a partial file."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
 def get_safe_name(name: str) -> str:
     """Returns the safe version of a username."""
     return name.lower().replace(' ', '_')
@@ -71,19 +103,7 @@ _mode_str_dict = {
 
 async def fetch_geoloc(ip: str) -> str:
     """Fetches the country code corresponding to an IP."""
-    url = f'http://ip-api.com/line/{ip}'
-
-    async with glob.http.get(url) as resp:
-        if not resp or resp.status != 200:
-            if glob.config.debug:
-                log('Failed to get geoloc data: request failed.', Ansi.LRED)
-            return 'xx'
-        status, *lines = (await resp.text()).split('\n')
-        if status != 'success':
-            if glob.config.debug:
-                log(f'Failed to get geoloc data: {lines[0]}.', Ansi.LRED)
-            return 'xx'
-        return lines[1].lower()
+    return await glob.geoloc.resolve(ip)
 
 
 async def validate_captcha(data: str) -> bool:
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('ScoreWatermarks',)
+
+import asyncio
+
+from cmyui.logging import Ansi
+from cmyui.logging import log
+
+from objects import glob
+
+
+class ScoreWatermarks:
+    """Tracks the highest score id in each of the scores tables.
+
+    Anything derived from a player's scores can remember the
+    watermark it was computed at, and only needs to look at
+    scores above it to catch up."""
+
+    __slots__ = ('current',)
+
+    def __init__(self) -> None:
+        # {mods: max score id}
+        self.current: dict[str, int] = {}
+
+    def get(self, mods: str) -> int:
+        """Return the last seen high-water mark for `scores_{mods}`."""
+        return self.current.get(mods, 0)
+
+    async def refresh(self) -> None:
+        for mods in ('vn', 'rx', 'ap'):
+            res = await glob.db.fetch(
+                f'SELECT MAX(id) AS max_id FROM scores_{mods}'
+            )
+            self.current[mods] = res['max_id'] or 0
+
+    async def run(self, interval: int) -> None:
+        """Refresh the watermarks every `interval` seconds."""
+        while True:
+            await asyncio.sleep(interval)
+
+            try:
+                await self.refresh()
+            except Exception as exc:
+                log(f'Failed to refresh score watermarks: {exc}', Ansi.LRED)
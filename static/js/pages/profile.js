@@ -26,70 +26,51 @@ new Vue({
     },
     created() {
         // starting a page
-        this.LoadProfileData("std", "vn");
-        this.LoadAllofdata();
+        this.LoadProfile();
+        this.LoadRankHistory();
     },
     methods: {
-        LoadAllofdata() {
-            this.LoadMostBeatmaps();
-            this.LoadScores('best');
-            this.LoadScores('recent');
-            this.LoadGrades();
-            this.getGlobalRank();
-            this.getCountryRank();
-        },
         GettingUrl() {
             return `${window.location.protocol}//${window.location.hostname}:${window.location.port}`
         },
-        LoadProfileData(mode, mods) {
+        LoadProfile() {
+            // fetches every section of the profile in a single request
             var vm = this;
-            vm.$axios.get(`${this.GettingUrl()}/gw_api/get_user_info`, {
+            vm.data.scores.load = [true, true, true];
+            vm.$axios.get(`${this.GettingUrl()}/gw_api/get_profile`, {
                     params: {
                         id: vm.userid,
-                        mode: mode,
-                        mods: mods,
+                        mode: vm.mode,
+                        mods: vm.mods,
+                        limit: vm.limit[0],
                     }
                 })
                 .then(function (response) {
-                    vm.data.stats = response.data.userdata;
+                    var profile = response.data;
+                    vm.data.stats = profile.info.userdata;
+                    vm.data.grades = profile.grades;
+                    vm.data.ranking.global = `#${profile.rank.global}`;
+                    vm.data.ranking.country = `#${profile.rank.country}`;
+                    vm.data.scores.best = profile.best.scores;
+                    vm.data.scores.recent = profile.recent.scores;
+                    vm.data.scores.most = profile.most;
+                    vm.data.scores.load = [false, false, false];
                 });
         },
-        LoadGrades() {
+        LoadRankHistory() {
             var vm = this;
-            vm.$axios.get(`${this.GettingUrl()}/gw_api/get_user_grade`, {
+            vm.$axios.get(`${this.GettingUrl()}/gw_api/get_rank_history`, {
                     params: {
                         id: vm.userid,
                         mode: vm.mode,
                         mods: vm.mods,
+                        days: 90,
                     }
                 })
                 .then(function (response) {
-                    vm.data.grades = response.data;
+                    vm.data.ranking.history = response.data.history;
                 });
         },
-        getGlobalRank() {
-            var vm = this;
-            let res = vm.$axios.get(`${this.GettingUrl()}/gw_api/get_player_rank`, {
-                params: {
-                    userid: vm.userid,
-                    mode: vm.mode,
-                    mods: vm.mods,
-                }
-            })
-            vm.data.ranking.global = `#${res.data.rank}`;
-        },
-        getCountryRank() {
-            var vm = this;
-            let res = vm.$axios.get(`${this.GettingUrl()}/gw_api/get_player_rank`, {
-                params: {
-                    userid: vm.userid,
-                    mode: vm.mode,
-                    mods: vm.mods,
-                    country: vm.data.stats.country,
-                }
-            })
-            vm.data.ranking.country = `#${res.data.rank}`;
-        },
         LoadScores(sort) {
             var vm = this;
             let type;
@@ -144,8 +125,8 @@ new Vue({
             vm.limit[0] = 5;
             vm.limit[1] = 5;
             vm.limit[2] = 5;
-            vm.LoadProfileData(mode, mods)
-            vm.LoadAllofdata()
+            vm.LoadProfile()
+            vm.LoadRankHistory()
         },
         ShowMore(sort) {
             var vm = this;
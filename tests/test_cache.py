@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+# usage: python3.9 -m unittest discover tests
+
+import asyncio
+import unittest
+
+from objects.backends import MemoryBackend
+from objects.cache import ResponseCache
+
+
+class GetOrSetTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.cache = ResponseCache(MemoryBackend(max_size=16), ttl=60)
+
+    async def test_cancelled_producer_releases_waiters(self) -> None:
+        started = asyncio.Event()
+        calls = 0
+
+        async def slow() -> str:
+            nonlocal calls
+            calls += 1
+            started.set()
+            await asyncio.sleep(60)
+            return 'slow'
+
+        async def fast() -> str:
+            nonlocal calls
+            calls += 1
+            return 'fast'
+
+        leader = asyncio.create_task(self.cache.get_or_set('key', slow))
+        await started.wait()
+
+        waiters = [asyncio.create_task(self.cache.get_or_set('key', fast))
+                   for _ in range(3)]
+        await asyncio.sleep(0)  # let them join the leader
+
+        leader.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+
+        # one waiter takes over as producer; the rest share its value.
+        results = await asyncio.wait_for(asyncio.gather(*waiters), timeout=1)
+        self.assertEqual(results, ['fast'] * 3)
+        self.assertEqual(calls, 2)
+        self.assertFalse(self.cache.inflight)
+
+    async def test_cancelled_waiter_leaves_producer_running(self) -> None:
+        release = asyncio.Event()
+
+        async def produce() -> str:
+            await release.wait()
+            return 'value'
+
+        leader = asyncio.create_task(self.cache.get_or_set('key', produce))
+        await asyncio.sleep(0)
+
+        waiter = asyncio.create_task(self.cache.get_or_set('key', produce))
+        await asyncio.sleep(0)
+
+        waiter.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+
+        release.set()
+        self.assertEqual(await leader, 'value')
+        self.assertEqual(await self.cache.get('key'), 'value')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+# usage: python3.9 -m unittest discover tests
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from objects.geoloc import GeoDatabase
+from objects.geoloc import GeoResolver
+from objects.geoloc import build_database
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'geoloc.csv')
+
+
+def build_fixture(path: str) -> int:
+    with open(FIXTURE) as f:
+        return build_database((line.strip().split(',') for line in f), path)
+
+
+class GeoDatabaseTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp.name, 'geoloc.db')
+        self.ranges = build_fixture(path)
+        self.db = GeoDatabase(path)
+
+    def tearDown(self) -> None:
+        del self.db
+        self.tmp.cleanup()
+
+    def test_skips_ipv6_and_malformed_rows(self) -> None:
+        self.assertEqual(self.ranges, 6)
+        self.assertEqual(self.db.count, 6)
+
+    def test_lookup(self) -> None:
+        self.assertEqual(self.db.lookup('1.0.0.0'), 'au')  # first address
+        self.assertEqual(self.db.lookup('1.0.7.255'), 'au')  # last address
+        self.assertEqual(self.db.lookup('1.2.3.4'), 'cn')  # given as integers
+        self.assertEqual(self.db.lookup('8.8.8.8'), 'us')  # (rows are unsorted)
+        self.assertEqual(self.db.lookup('255.255.255.255'), 'zz')
+
+    def test_misses(self) -> None:
+        self.assertIsNone(self.db.lookup('0.255.255.255'))  # before any range
+        self.assertIsNone(self.db.lookup('1.0.1.0'))  # in a gap
+        self.assertIsNone(self.db.lookup('9.9.9.9'))  # malformed country
+        self.assertIsNone(self.db.lookup('2001:db8::1'))  # ipv6
+        self.assertIsNone(self.db.lookup('not an ip'))
+
+
+class GeoResolverTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp.name, 'geoloc.db')
+        build_fixture(path)
+
+        self.resolver = GeoResolver(GeoDatabase(path), max_size=2,
+                                    ttl=60, timeout=1)
+        self.fetched = []
+
+        async def fetch_remote(ips: list[str]) -> dict[str, str]:
+            self.fetched.append(sorted(ips))
+            return {ip: 'jp' for ip in ips if ip.startswith('3.')}
+
+        self.resolver._fetch_remote = fetch_remote
+
+    def tearDown(self) -> None:
+        del self.resolver
+        self.tmp.cleanup()
+
+    async def test_local_before_remote(self) -> None:
+        resolved = await self.resolver.resolve_many(
+            ['8.8.8.8', '3.0.0.1', '4.0.0.1', '8.8.8.8'])
+
+        self.assertEqual(resolved, {'8.8.8.8': 'us', '3.0.0.1': 'jp',
+                                    '4.0.0.1': 'xx'})
+        self.assertEqual(self.fetched, [['3.0.0.1', '4.0.0.1']])  # one request
+
+    async def test_remote_results_are_cached(self) -> None:
+        self.assertEqual(await self.resolver.resolve('3.0.0.1'), 'jp')
+        self.assertEqual(await self.resolver.resolve('3.0.0.1'), 'jp')
+        self.assertEqual(len(self.fetched), 1)
+
+        # failures aren't; they're retried next time.
+        await self.resolver.resolve('4.0.0.1')
+        await self.resolver.resolve('4.0.0.1')
+        self.assertEqual(len(self.fetched), 3)
+
+    async def test_cache_is_lru(self) -> None:
+        await self.resolver.resolve_many(['3.0.0.1', '3.0.0.2'])
+        await self.resolver.resolve('3.0.0.1')  # now the most recent
+        await self.resolver.resolve('3.0.0.3')  # evicts 3.0.0.2
+
+        self.assertEqual(list(self.resolver.cache), ['3.0.0.1', '3.0.0.3'])
+
+    async def test_cache_expires(self) -> None:
+        with mock.patch('objects.geoloc.time.monotonic', return_value=1000):
+            await self.resolver.resolve('3.0.0.1')
+
+        with mock.patch('objects.geoloc.time.monotonic', return_value=1059):
+            self.assertEqual(self.resolver.resolve_local('3.0.0.1'), 'jp')
+
+        with mock.patch('objects.geoloc.time.monotonic', return_value=1061):
+            self.assertIsNone(self.resolver.resolve_local('3.0.0.1'))
+            self.assertNotIn('3.0.0.1', self.resolver.cache)
+
+
+if __name__ == '__main__':
+    unittest.main()